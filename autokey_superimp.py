@@ -5,24 +5,31 @@
 
 from matplotlib import pyplot as plt
 
+import cache
 from data import eye_messages
 from tests import kappa_test
 
 bounds = (1, 40)
 
 
-def main():
-    x = list(range(*bounds))
+@cache.cached(version=1, params=("bounds",))
+def coincidence_rates(msgs=eye_messages):
     results_y = []
-    for w in x:
+    for w in range(*bounds):
         matches = 0
         checks = 0
-        for i in range(9):
-            match, check = kappa_test(eye_messages[i], eye_messages[i], w)
+        for m in msgs:
+            match, check = kappa_test(m, m, w)
             matches += match
             checks += check
 
         results_y.append(1000 * matches / checks)
+    return results_y
+
+
+def main():
+    x = list(range(*bounds))
+    results_y = coincidence_rates()
 
     plt.bar(x, results_y, 0.8, label="Coincidences per 1000")
     plt.plot(bounds, (66, 66), 'g', label="Expected (English)")
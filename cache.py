@@ -0,0 +1,157 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import time
+import zlib
+
+from pipeline import update_hash
+
+# Persistent result cache
+#
+# Analyses opt in with the `cached` decorator. A result is stored under a key made from the function's name and
+# version, the module-level constants it reads, and its arguments. Corpora among the arguments are keyed by the
+# hash of their contents, pipeline nodes by their transform chain.
+#
+# Each result is pickled, compressed, and written to its own file in CACHE_DIR, next to this module unless
+# EYE_CACHE_DIR says otherwise. Files are written to a temporary
+# name and renamed into place, so any number of readers can run alongside a writer without seeing partial results.
+# Entries older than MAX_AGE seconds are evicted, and when the cache grows beyond MAX_BYTES the least recently
+# used entries go first. The cache is best-effort: an entry which can't be read is a miss, and a result which
+# can't be stored is still returned.
+
+CACHE_DIR = os.environ.get("EYE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+MAX_BYTES = 512 * 2 ** 20
+MAX_AGE = 30 * 24 * 60 * 60
+
+# Set to False to make every cached function recompute its result
+enabled = True
+
+
+def make_key(func, version, params, arguments):
+    h = hashlib.sha256()
+    update_hash(h, (func.__module__, func.__qualname__, version, params, arguments))
+    return h.hexdigest()
+
+
+def load(key):
+    """
+    Return (True, result) for a cached result, or (False, None).
+    """
+    path = os.path.join(CACHE_DIR, key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return False, None
+    try:
+        result = pickle.loads(zlib.decompress(data))
+    except Exception:
+        # Corrupt, or pickled against classes which have changed since
+        return False, None
+    try:
+        # Mark the entry as recently used
+        os.utime(path)
+    except OSError:
+        pass
+    return True, result
+
+
+def store(key, result):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    data = zlib.compress(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(CACHE_DIR, key))
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    evict()
+
+
+def evict(max_bytes=None, max_age=None):
+    """
+    Remove entries older than max_age, then the least recently used entries until the cache fits in max_bytes.
+    Other processes may be evicting at the same time, so entries can disappear while this runs.
+    """
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    max_age = MAX_AGE if max_age is None else max_age
+    now = time.time()
+    entries = []
+    try:
+        names = os.listdir(CACHE_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        # Leave temporary files alone unless they were abandoned by a crashed writer
+        age_limit = 60 * 60 if name.startswith(".tmp") else max_age
+        if now - st.st_mtime > age_limit:
+            _remove(path)
+        elif not name.startswith(".tmp"):
+            entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def clear():
+    evict(max_bytes=0)
+
+
+def cached(version, params=()):
+    """
+    Cache a function's results on disk.
+
+    :param version: Change this whenever the function's results change, to invalidate older entries.
+    :param params: Names of the module-level constants the function reads, such as "max_size".
+        Their current values are part of the key.
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = make_key(func, version, {name: func.__globals__[name] for name in params}, bound.arguments)
+            hit, result = load(key)
+            if hit:
+                return result
+            result = func(*args, **kwargs)
+            try:
+                store(key, result)
+            except (OSError, pickle.PicklingError, TypeError, AttributeError):
+                # The result stands whether or not it could be cached
+                pass
+            return result
+
+        wrapper.uncached = func
+        return wrapper
+
+    return decorator
@@ -0,0 +1,110 @@
+# Out-of-core statistics for very large ciphertexts
+#
+# Letter frequencies, phi tests and kappa tests for ciphertexts too large to hold in memory, such as the synthetic
+# ciphertexts used to calibrate thresholds. Ciphertexts are memory-mapped files (or any array), read in blocks of
+# chunk_size letters. The counts of the blocks are computed on a thread pool and summed, so the results are exactly
+# those of simple_freq and tests, while memory use depends only on the chunk size and the number of threads.
+#
+# A ciphertext file is one letter per byte. Writes the frequency statistics and the autokey superimposition of the
+# file named on the command line to stdout.
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import autokey_superimp
+import tests
+
+chunk_size = 2 ** 22
+
+
+def open_ciphertext(filename, dtype=np.uint8):
+    return np.memmap(filename, dtype=dtype, mode="r")
+
+
+def _sum_chunks(func, length, chunk_size, workers):
+    """
+    Sum func(start, stop) over consecutive chunks of range(length).
+    """
+    chunks = [(start, min(start + chunk_size, length)) for start in range(0, length, chunk_size)]
+    with ThreadPoolExecutor(workers) as executor:
+        return sum(executor.map(lambda chunk: func(*chunk), chunks))
+
+
+def bincount(msg, minlength=83, chunk_size=chunk_size, workers=None):
+    """
+    Same as np.bincount(msg, minlength=minlength).
+    """
+    def count(start, stop):
+        return np.bincount(msg[start:stop], minlength=minlength)
+
+    counts = _sum_chunks(count, len(msg), chunk_size, workers)
+    return np.zeros(minlength, dtype=np.int64) if isinstance(counts, int) else counts
+
+
+def phi_test(msg, minlength=83, chunk_size=chunk_size, workers=None):
+    """
+    Same as tests.phi_test of the letter distribution of msg.
+    """
+    return tests.phi_test(bincount(msg, minlength, chunk_size, workers))
+
+
+def kappa_sweep(msg1, msg2, widths, chunk_size=chunk_size, workers=None):
+    """
+    Same as tests.kappa_test(msg1, msg2, width) for each of the widths, in one pass over the ciphertexts.
+
+    Each chunk of msg2 is compared with a block of msg1 that extends past the chunk by the widest shift, so the
+    comparisons which cross a chunk boundary are made in the chunk where they start.
+    :return: (N, D) tuple of arrays with one element per width
+    """
+    widths = np.asarray(widths)
+    lo, hi = int(widths.min()), int(widths.max())
+    # Number of comparisons at each width
+    lengths = np.clip(np.minimum(len(msg1) - widths, len(msg2)), 0, None)
+
+    def count(start, stop):
+        block1 = np.asarray(msg1[start + lo:stop + hi])
+        block2 = np.asarray(msg2[start:stop])
+        matches = np.zeros(len(widths), dtype=np.int64)
+        for k, w in enumerate(widths):
+            n = min(stop, lengths[k]) - start
+            if n > 0:
+                matches[k] = np.count_nonzero(block1[w - lo:w - lo + n] == block2[:n])
+        return matches
+
+    matches = _sum_chunks(count, int(lengths.max(initial=0)), chunk_size, workers)
+    if isinstance(matches, int):
+        matches = np.zeros(len(widths), dtype=np.int64)
+    return matches, lengths
+
+
+def kappa_test(msg1, msg2, width, chunk_size=chunk_size, workers=None):
+    """
+    Same as tests.kappa_test.
+    """
+    matches, checks = kappa_sweep(msg1, msg2, [width], chunk_size, workers)
+    return matches[0], int(checks[0])
+
+
+def main():
+    msg = open_ciphertext(sys.argv[1])
+
+    bins = bincount(msg)
+    binsort = np.argsort(bins)
+    print(f"Letters: {len(msg)}")
+    print(f"5 most common letters: {binsort[-5:]}")
+    print(f"5 least common letters: {binsort[:5]}")
+    print(f"Median frequency: {np.median(bins)}")
+    print(f"Mean frequency: {np.mean(bins)}")
+    matches, checks = tests.phi_test(bins)
+    print(f"Coincidence rate: {(matches * 1000 // max(checks, 1)):>4} per thousand")
+
+    widths = list(range(*autokey_superimp.bounds))
+    matches, checks = kappa_sweep(msg, msg, widths)
+    for w, match, check in zip(widths, matches, checks):
+        print(f"Offset {w:>3}: {(match * 1000 // max(check, 1)):>4} per thousand")
+
+
+if __name__ == '__main__':
+    main()
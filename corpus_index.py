@@ -0,0 +1,175 @@
+# Incrementally updated corpus indexes
+#
+# Keeps the repeat structure, letter positions, letter frequencies and pairwise coincidence counts of a corpus up to
+# date as messages are appended one at a time. Appending a message only visits the strings of the new message and
+# the pairs of messages which include it, rather than recomputing everything. Indexes can be saved to disk and
+# loaded again, so a corpus can grow across sessions.
+#
+# Writes the statistics after each eye message is added to stdout.
+
+import os
+import pickle
+import tempfile
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+import repeats
+from data import eye_messages
+from tests import kappa_test
+
+# Coincidences are counted for shifts up to this width, which covers the bounds in stat_period and autokey_superimp
+max_width = 90
+
+
+class CorpusIndex:
+    """
+    The repeats are kept the way find_repeats builds them: every string of 2 to max_size - 1 letters maps to its set
+    of positions. A repeat is one of the longest if no string one letter longer has the same positions. Only the
+    strings in a new message gain positions, and only those strings have longer strings which gain positions, so
+    those are the only repeats to check again.
+
+    matches[i, j, w] and checks[i, j, w] are the kappa_test of messages i and j at width w. They are views of arrays
+    with room for more messages, which double in size when they fill up, so an append only writes the new rows and
+    columns.
+    """
+
+    def __init__(self, msgs=(), alphabet=83):
+        self.messages = []
+        self.frequencies = np.zeros(alphabet, dtype=np.int64)
+        # letter -> [(message, position), ...]
+        self.letter_positions = defaultdict(list)
+        self._matches = np.zeros((0, 0, max_width), dtype=np.int64)
+        self._checks = np.zeros((0, 0, max_width), dtype=np.int64)
+        # (i, j) -> positions where messages i and j coincide with no shift, and the number of positions tested
+        self.positional = {}
+
+        self._strings = defaultdict(set)
+        self._extensions = defaultdict(set)
+        self._repeats = {}
+
+        for m in msgs:
+            self.append(m)
+
+    def __len__(self):
+        return len(self.messages)
+
+    @property
+    def matches(self):
+        n = len(self.messages)
+        return self._matches[:n, :n]
+
+    @property
+    def checks(self):
+        n = len(self.messages)
+        return self._checks[:n, :n]
+
+    def append(self, msg):
+        msg = np.asarray(msg)
+        k = len(self.messages)
+        self.messages.append(msg)
+
+        self.frequencies += np.bincount(msg, minlength=len(self.frequencies))
+        for pos, letter in enumerate(msg.tolist()):
+            self.letter_positions[letter].append((k, pos))
+
+        self._update_repeats(msg)
+        self._update_coincidences(msg)
+
+    def _update_repeats(self, msg):
+        touched = set()
+        for pos in range(len(msg) - 1):
+            for size in range(2, repeats.max_size):
+                key = bytes(tuple(msg[pos:pos + size]))
+                self._strings[key].add(pos)
+                touched.add(key)
+                if len(key) > 2:
+                    self._extensions[key[:-1]].add(key)
+
+        for key in touched:
+            positions = self._strings[key]
+            if len(positions) > 1 and not any(len(self._strings[longer]) == len(positions)
+                                              for longer in self._extensions[key]):
+                self._repeats[tuple(key)] = positions
+            else:
+                self._repeats.pop(tuple(key), None)
+
+    def _update_coincidences(self, msg):
+        k = len(self.messages) - 1
+        capacity = len(self._matches)
+        if k >= capacity:
+            grown = max(2 * capacity, 1)
+            for name in ("_matches", "_checks"):
+                array = np.zeros((grown, grown, max_width), dtype=np.int64)
+                array[:capacity, :capacity] = getattr(self, name)
+                setattr(self, name, array)
+        for i, m in enumerate(self.messages):
+            for w in range(max_width):
+                self._matches[k, i, w], self._checks[k, i, w] = kappa_test(msg, m, w)
+                self._matches[i, k, w], self._checks[i, k, w] = kappa_test(m, msg, w)
+            if i < k:
+                length = min(len(m), len(msg))
+                self.positional[i, k] = np.flatnonzero(m[:length] == msg[:length]), length
+
+    def repeats(self):
+        """
+        :return: The same as find_repeats for the messages so far
+        """
+        return {key: set(positions) for key, positions in self._repeats.items()}
+
+    def coincidence_rates(self, bounds):
+        """
+        Coincidences per 1000 of every message against every message at each width, as in stat_period.
+        """
+        w = slice(*bounds)
+        return list(1000 * self.matches[:, :, w].sum((0, 1)) / self.checks[:, :, w].sum((0, 1)))
+
+    def autokey_rates(self, bounds):
+        """
+        Coincidences per 1000 of every message against itself at each width, as in autokey_superimp.
+        """
+        w = slice(*bounds)
+        return list(1000 * np.trace(self.matches[:, :, w]) / np.trace(self.checks[:, :, w]))
+
+    def positional_test(self, start=0):
+        """
+        :return: The same (checks, matches) as superimp_positional.do_test
+        """
+        checks = 0
+        matches = 0
+        for positions, length in self.positional.values():
+            checks += max(length - start, 0)
+            matches += np.count_nonzero(positions >= start)
+        return checks, matches
+
+    def save(self, filename):
+        """
+        Write a snapshot of the index. The file is replaced in one step, so readers never see a partial snapshot.
+        """
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(zlib.compress(pickle.dumps(self, pickle.HIGHEST_PROTOCOL)))
+        os.replace(tmp_path, filename)
+
+    @staticmethod
+    def load(filename) -> 'CorpusIndex':
+        with open(filename, "rb") as f:
+            return pickle.loads(zlib.decompress(f.read()))
+
+
+def main():
+    index = CorpusIndex()
+    for msgnum, m in enumerate(eye_messages):
+        index.append(m)
+        checks, matches = index.positional_test()
+        print(f"== Messages 0-{msgnum} ==\n"
+              f"Repeats:          {len(index.repeats()):>5}\n"
+              f"Distinct letters: {np.count_nonzero(index.frequencies):>5}")
+        if checks:
+            print(f"Coincidence rate: {(matches * 1000 // checks):>4} per thousand")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# Messages in depth
+#
+# Superimposes every pair of messages at every relative offset and takes the difference of the overlapping letters,
+# (m1[t + offset] - m2[t]) % 83, like autokey_decrypt does within one message. If two messages were enciphered with
+# the same key at some alignment, the key cancels out of the difference stream, which then shows the statistics of
+# the plaintext instead of random letters: a higher rate of coincidence and more repeated bigrams.
+#
+# The difference streams of a block of messages against all messages at one offset are computed as one array, and
+# only the best streams are kept.
+#
+# Writes the best alignments to stdout.
+
+import heapq
+
+import numpy as np
+
+from data import eye_messages
+
+top = 20
+min_overlap = 25
+
+
+def pad_messages(msgs):
+    """
+    :return: The messages as the rows of one array, padded with -1
+    """
+    padded = np.full((len(msgs), max(len(m) for m in msgs)), -1, dtype=np.int64)
+    for i, m in enumerate(msgs):
+        padded[i, :len(m)] = m
+    return padded
+
+
+def difference_streams(padded, rows, offset, modulus=83):
+    """
+    :return: (R, M, L) array of the difference streams of the messages in `rows`, shifted by offset, against every
+        message, and the mask of valid letters in the streams
+    """
+    length = padded.shape[1] - abs(offset)
+    a = padded[rows, max(offset, 0):max(offset, 0) + length]
+    b = padded[:, max(-offset, 0):max(-offset, 0) + length]
+    valid = (a >= 0)[:, None, :] & (b >= 0)[None, :, :]
+    return (a[:, None, :] - b[None, :, :]) % modulus, valid
+
+
+def stream_stats(streams, valid, modulus=83):
+    """
+    Phi test and repeated bigrams for every stream along the last axis.
+
+    :return: (N, D, R) arrays, where N and D are as returned by tests.phi_test, and R is the number of bigrams
+        which repeat an earlier bigram of the stream
+    """
+    shape = streams.shape[:-1]
+    count = int(np.prod(shape))
+    stream_ids = np.arange(count).reshape(shape + (1,))
+    letter_counts = np.bincount((stream_ids * modulus + streams)[valid],
+                                minlength=count * modulus).reshape(shape + (modulus,))
+    n = valid.sum(-1)
+    matches = np.sum(letter_counts * (letter_counts - 1), -1)
+    checks = n * (n - 1)
+
+    bigrams = np.where(valid[..., :-1] & valid[..., 1:], streams[..., :-1] * modulus + streams[..., 1:], -1)
+    bigrams = np.sort(bigrams, -1)
+    repeated = np.sum((bigrams[..., 1:] == bigrams[..., :-1]) & (bigrams[..., 1:] >= 0), -1)
+    return matches, checks, repeated
+
+
+def find_depths(msgs=eye_messages, top=top, min_overlap=min_overlap, by="rate", modulus=83, block=64):
+    """
+    Score the difference streams of all message pairs at all offsets. A pair at some offset gives the same
+    stream, negated, as the reverse pair at the opposite offset, so each stream is scored once.
+
+    :param by: "rate" to rank streams by their rate of coincidence, "bigrams" by their number of repeated bigrams
+    :return: The best `top` streams, best first, as (rate, bigrams, i, j, offset, overlap) tuples
+    """
+    padded = pad_messages(msgs)
+    count, longest = padded.shape
+    j = np.arange(count)
+    best = []
+    for offset in range(-(longest - 1), longest):
+        for start in range(0, count, block):
+            i = np.arange(start, min(start + block, count))
+            streams, valid = difference_streams(padded, i, offset, modulus)
+            matches, checks, repeated = stream_stats(streams, valid, modulus)
+            overlap = valid.sum(-1)
+
+            keep = (i[:, None] < j[None, :]) | ((i[:, None] == j[None, :]) & (offset > 0))
+            keep &= overlap >= min_overlap
+            rate = np.where(keep, matches / np.maximum(checks, 1), -1.)
+            score = rate if by == "rate" else np.where(keep, repeated, -1)
+
+            flat = score.ravel()
+            candidates = np.argpartition(-flat, min(top, flat.size - 1))[:top]
+            for c in candidates[flat[candidates] >= 0]:
+                a, b = np.unravel_index(c, score.shape)
+                entry = (float(score[a, b]), float(rate[a, b]), int(repeated[a, b]),
+                         int(i[a]), int(b), offset, int(overlap[a, b]))
+                if len(best) < top:
+                    heapq.heappush(best, entry)
+                else:
+                    heapq.heappushpop(best, entry)
+
+    return [entry[1:] for entry in sorted(best, reverse=True)]
+
+
+def main():
+    print("Rate/1000  Bigrams  Messages  Offset  Overlap")
+    for rate, bigrams, i, j, offset, overlap in find_depths():
+        print(f"{rate * 1000:>9.1f}  {bigrams:>7}  {i:>3}-{j:<4}  {offset:>6}  {overlap:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
 import itertools
 from collections import Counter
 
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
 from prac_crib import word_score
 
 raw_lore = """
@@ -117,6 +120,83 @@ def superimpose(lore1, lore2, x=0, y=0, w=0):
     return ''.join([a for a in s if a is not None])
 
 
+# The sweep below repeats the experiment with every letter as the grille hole, to see whether E stands out. Each
+# message is turned into a character grid, and each orientation of it (quarter turns, with and without transposing)
+# is used as a grille on every message it fits inside, at every alignment. The holes for all letters are found with
+# one comparison per grille, and the readouts for all alignments are taken from the same stack of target windows.
+# Readouts are in reading order and are taken in both directions. Duplicate readouts are only scored once.
+
+HOLE_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# Fills out the ragged lines of a grid. Never read out.
+PAD = '\0'
+
+
+def lore_grid(lines):
+    grid = np.full((len(lines), max(len(line) for line in lines)), PAD, dtype='<U1')
+    for y, line in enumerate(lines):
+        grid[y, :len(line)] = list(line)
+    return grid
+
+
+def grille_orientations(grid):
+    orientations = {}
+    for transposed, g in (("", grid), ("T", grid.T)):
+        for turns in range(4):
+            orientations[f"{transposed}R{turns * 90}"] = np.rot90(g, turns)
+    return orientations
+
+
+def sweep(hole_letters=HOLE_LETTERS, min_length=MINIMUM_LENGTH):
+    """
+    :return: {readout: (hole letter, grille message, orientation, target message, (y, x), reversed)} with the
+        first place each distinct readout was found
+    """
+    grids = [lore_grid(lines) for lines in lore_lines]
+    letters = np.array(list(hole_letters))
+    candidates = {}
+    for i, grid in enumerate(grids):
+        for orientation, grille in grille_orientations(grid).items():
+            h, w = grille.shape
+            masks = grille == letters[:, None, None]
+            for j, target in enumerate(grids):
+                if i == j or target.shape[0] < h or target.shape[1] < w:
+                    continue
+                # (y, x, h, w): the part of the target under the grille at each alignment
+                windows = sliding_window_view(target, (h, w))
+                for letter, mask in zip(hole_letters, masks):
+                    holes = int(mask.sum())
+                    if holes <= min_length:
+                        continue
+                    readouts = np.ascontiguousarray(windows[:, :, mask]).view(f'<U{holes}')[:, :, 0]
+                    for (y, x), readout in np.ndenumerate(readouts):
+                        msg = readout.replace(PAD, '')
+                        if len(msg) <= min_length:
+                            continue
+                        if msg not in candidates:
+                            candidates[msg] = (letter, i, orientation, j, (y, x), False)
+                        if msg[::-1] not in candidates:
+                            candidates[msg[::-1]] = (letter, i, orientation, j, (y, x), True)
+    return candidates
+
+
+def sweep_main():
+    scorer = word_score()
+
+    candidates = sweep()
+    results = [(scorer.score(msg), msg, found) for msg, found in candidates.items()]
+    results.sort(key=lambda a: a[0])
+
+    print("Hole  Readouts  Best score")
+    for letter in HOLE_LETTERS:
+        scores = [rating for rating, msg, found in results if found[0] == letter]
+        if scores:
+            print(f"{letter:>4}  {len(scores):>8}  {max(scores)}")
+
+    for rating, msg, (letter, i, orientation, j, (y, x), reverse) in results[-100:]:
+        print(f"{rating} {letter} {i}{orientation}->{j} ({y}, {x}){' reversed' if reverse else ''} {msg}")
+
+
 def main():
     scorer = word_score()
 
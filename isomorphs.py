@@ -1,10 +1,14 @@
 import itertools
-import random
-from collections import defaultdict
+import sys
+import time
+from collections import Counter, defaultdict
 from pprint import pprint
 from typing import List
 
 import colorhash as colorhash
+import numpy as np
+
+import cache
 
 
 NEARBY = 3
@@ -154,7 +158,7 @@ class IsomorphGroup:
     def msg_string(self, msg):
         return ", ".join(f"[{''.join(msg[position:position + self.max_offset])}]" for position in self.positions)
 
-    def intersect(self, other: 'IsomorphGroup') -> List['IsomorphGroup']:
+    def intersect(self, other: 'IsomorphGroup', nearby=None) -> List['IsomorphGroup']:
         """
         Given the set of positions in self and the set of positions in other, find each subset of the cartesian product
         of the two where the distance between elements of each pair in the subset is equal, and where that distance
@@ -181,12 +185,15 @@ class IsomorphGroup:
 
 
         :param other:
+        :param nearby: Defaults to NEARBY
         :return:
         """
+        if nearby is None:
+            nearby = NEARBY
         pairs_by_distance = defaultdict(list)
         for pos1, pos2 in itertools.product(self.positions, other.positions):
             dist = pos2 - pos1
-            if pos1 + self.max_offset >= pos2 - NEARBY and pos2 + other.max_offset >= pos1 - NEARBY:
+            if pos1 + self.max_offset >= pos2 - nearby and pos2 + other.max_offset >= pos1 - nearby:
                 pairs_by_distance[dist].append((pos1, pos2))
 
         subsets = [(dist, pairs) for dist, pairs in pairs_by_distance.items() if len(pairs) > 1]
@@ -221,40 +228,100 @@ class IsomorphGroup:
 
         return results
 
-    def split_enclosing(self, msg):
+    def split_enclosing(self, occurrences: 'Occurrences'):
         """
         Check each position in this group for repeated letters within the group. Return one or more new IsomorphGroups
         using the updated pattern.
-        :param msg:
+
+        The repeated letters of each position's window are looked up in the occurrence table, which works them out
+        once per position for every group. Positions are grouped by those pairs, and only the distinct sets of pairs
+        are merged into the pattern.
+        :param occurrences: Occurrences of the message, or the message itself
         :return:
         """
-        # print(f"Splitting {self.msg_string(msg)}")
-        position_patterns = defaultdict(list)
+        if not isinstance(occurrences, Occurrences):
+            occurrences = Occurrences(occurrences)
+        width = self.max_offset
+        position_pairs = defaultdict(list)
         for position in self.positions:
-            pattern = set(self.pattern)
-            letter_offsets = {}
-            for offset, letter in enumerate(msg[position:position + self.max_offset]):
-                if letter in letter_offsets:
-                    prev_offset = letter_offsets[letter]
-                    pattern.add((prev_offset, offset - prev_offset))
-                    del letter_offsets[letter]
-                else:
-                    letter_offsets[letter] = offset
-            position_patterns[tuple(sorted(pattern))].append(position)
+            position_pairs[occurrences.window(position, width)].append(position)
+
+        if len(position_pairs) == 1:
+            (pairs, positions), = position_pairs.items()
+            return [IsomorphGroup(positions, frozenset(self.pattern + pairs))] if len(positions) > 1 else []
+        # Windows which differ only by pairs already in the pattern have the same new pattern
+        position_patterns = defaultdict(list)
+        for pairs, positions in position_pairs.items():
+            position_patterns[frozenset(self.pattern + pairs)].extend(positions)
+        return [IsomorphGroup(positions, pattern) for pattern, positions in position_patterns.items()
+                if len(positions) > 1]
+
+
+class Occurrences:
+    """
+    Letter occurrences in a message, precomputed once per message and shared by every group in find_isomorphs.
+
+    prev[i] is the position of the previous occurrence of msg[i], or -1.
+
+    window(p, width) is the (offset, size) pairs of repeated letters in the window of that width starting at p.
+    Within a window, split_enclosing pairs the first occurrence of a letter with the second, the third with the
+    fourth, and so on. That depends only on where the window starts, so the pairs of a narrower window are the
+    first pairs of a wider one. The pairs of every width are kept for each position, and computed again for twice
+    the width when a wider window is needed.
+    """
 
-        result = [IsomorphGroup(position_patterns[pattern], pattern)
-                  for pattern in position_patterns]
-        # print(f"Split {self.pattern_string()} into {[r.pattern_string() for r in result]}")
-        return [a for a in result if len(a.positions) > 1]
+    def __init__(self, msg):
+        self.msg = msg
+        codes = {}
+        letters = np.array([codes.setdefault(letter, len(codes)) for letter in msg], dtype=np.int64)
+        order = np.argsort(letters, kind="stable")
+        same = letters[order[1:]] == letters[order[:-1]]
+        self.prev = np.full(len(letters), -1)
+        self.prev[order[1:][same]] = order[:-1][same]
 
+        self._prev = self.prev.tolist()
+        # position -> the pairs of the window of each width starting there, up to some width
+        self._windows = {}
 
-def get_initial_groups(msg):
+    def __len__(self):
+        return len(self.prev)
+
+    def window(self, position, width):
+        """
+        :return: The (offset, size) pairs of repeated letters in the window, in order of the offset of their end
+        """
+        windows = self._windows.get(position)
+        if windows is None or len(windows) <= width:
+            prev = self._prev
+            stop = min(position + max(width, 2 * len(windows) if windows else 8), len(prev))
+            windows = [()]
+            pairs = ()
+            second = set()
+            for end in range(position, stop):
+                start = prev[end]
+                # The letter pairs up with its previous occurrence, if that is in the window and not already
+                # paired with an occurrence before it.
+                if start >= position and start not in second:
+                    second.add(end)
+                    pairs += ((start - position, end - start),)
+                windows.append(pairs)
+            if position + width > len(prev):
+                # Past the end of the message windows gain no pairs
+                windows.extend([pairs] * (width + 1 - len(windows)))
+            self._windows[position] = windows
+        return windows[width]
+
+
+def get_initial_groups(msg, max_distance=None):
     """
     For each letter in the alphabet, find its positions, and then find the distance between
     each pair of positions. Group the gaps by distance. Return an IsomorphGroup for each distance.
     :param msg:
+    :param max_distance: Defaults to MAX_DISTANCE
     :return:
     """
+    if max_distance is None:
+        max_distance = MAX_DISTANCE
     positions = defaultdict(list)
     for i, letter in enumerate(msg):
         positions[letter].append(i)
@@ -267,7 +334,7 @@ def get_initial_groups(msg):
         for i, p1 in enumerate(pos[:-1]):
             p2 = pos[i + 1]
             size = p2 - p1
-            if size > MAX_DISTANCE:
+            if size > max_distance:
                 continue
 
             groups_by_size[size].append(p1)
@@ -277,29 +344,215 @@ def get_initial_groups(msg):
     return [IsomorphGroup(positions, [(0, size)]) for size, positions in gbs]
 
 
-def find_isomorphs(msg) -> List[IsomorphGroup]:
-    initial_groups = get_initial_groups(msg)
-
-    result = []
-    # Get the intersections of each pair of groups.
-    isects = set([c for a, b in itertools.combinations(initial_groups, 2) for c in a.intersect(b)])
-    isects = [c for a in isects for c in a.split_enclosing(msg)]
-    while len(isects):
-        next_isects = set([c for a, b in itertools.product(isects, initial_groups) for c in a.intersect(b)])
-        next_isects = [c for a in next_isects for c in a.split_enclosing(msg)]
-        result.extend(isects)
-        isects = next_isects
+class SearchWork:
+    """
+    Work shared by searches of one message with different NEARBY and MAX_DISTANCE settings.
+
+    The occurrence table and the splits of each group depend on neither setting. The initial groups for a MAX_DISTANCE
+    are the initial groups for any larger one, up to that size, so they are found once for all distances. Intersecting
+    two groups only depends on NEARBY, so the results are kept for every search with the same NEARBY.
+
+    With memoize=False, only the occurrence table is kept, which is all a single search needs.
+    """
+
+    def __init__(self, msg, memoize=True):
+        self.msg = msg
+        self.memoize = memoize
+        self.occurrences = Occurrences(msg)
+        self._initial_groups = None
+        self._intersections = defaultdict(dict)
+        self._splits = {}
+
+    def initial_groups(self, max_distance):
+        if not self.memoize:
+            return get_initial_groups(self.msg, max_distance)
+        if self._initial_groups is None:
+            self._initial_groups = get_initial_groups(self.msg, len(self.msg))
+        return [g for g in self._initial_groups if g.max_offset <= max_distance]
+
+    def intersect(self, a: IsomorphGroup, b: IsomorphGroup, nearby) -> List[IsomorphGroup]:
+        """
+        :return: The intersections of a and b, split
+        """
+        if not self.memoize:
+            return [d for c in a.intersect(b, nearby) for d in c.split_enclosing(self.occurrences)]
+        intersections = self._intersections[nearby]
+        result = intersections.get((a, b))
+        if result is None:
+            result = intersections[a, b] = [d for c in a.intersect(b, nearby) for d in self.split_enclosing(c)]
+        return result
+
+    def split_enclosing(self, group: IsomorphGroup) -> List[IsomorphGroup]:
+        result = self._splits.get(group)
+        if result is None:
+            result = self._splits[group] = group.split_enclosing(self.occurrences)
+        return result
+
+
+class IsomorphSearch:
+    """
+    Search for isomorph groups generation by generation, yielding each group as soon as it is final.
+
+    Each generation intersects the groups of the previous one (the frontier) with the initial groups. A new group only
+    has positions taken from its parents, so once no group in the frontier covers all of a group's positions, nothing
+    found later can have the same positions and contain it. The group is then final. Only groups which are not final
+    yet are held in memory, along with the frontier.
+
+    The search stops early when it reaches one of its limits. It then yields all the groups it holds as they are,
+    and sets `limit` to the name of the limit which was reached:
+        "order": groups with a higher order than max_order were dropped
+        "time": the search took longer than time_budget seconds
+        "memory": the groups held took more than memory_budget bytes (estimated)
+    `limit` is None if the results are complete.
+    """
+
+    def __init__(self, msg, max_order=None, min_size=2, time_budget=None, memory_budget=None,
+                 nearby=None, max_distance=None, work: SearchWork = None):
+        """
+
+        :param msg:
+        :param max_order: Largest number of letter pairs in a group's pattern
+        :param min_size: Smallest number of positions in a group. Smaller groups are not searched further.
+        :param time_budget: Seconds
+        :param memory_budget: Bytes
+        :param nearby: Defaults to NEARBY
+        :param max_distance: Defaults to MAX_DISTANCE
+        :param work: Work shared with other searches of msg
+        """
+        self.msg = msg
+        self.max_order = max_order
+        self.min_size = min_size
+        self.time_budget = time_budget
+        self.memory_budget = memory_budget
+        self.nearby = nearby
+        self.max_distance = max_distance
+        self.work = work
+        self.limit = None
+
+    def __iter__(self):
+        self.limit = None
+        deadline = None if self.time_budget is None else time.monotonic() + self.time_budget
+        nearby = NEARBY if self.nearby is None else self.nearby
+        work = SearchWork(self.msg, memoize=False) if self.work is None else self.work
+        initial_groups = work.initial_groups(MAX_DISTANCE if self.max_distance is None else self.max_distance)
+
+        pending = set()
+        # Get the intersections of each pair of groups.
+        pairs = ((a, initial_groups[i + 1:]) for i, a in enumerate(initial_groups))
+        isects = self._generation(pairs, work, nearby, deadline)
+        while isects:
+            next_isects = self._generation(((a, initial_groups) for a in isects), work, nearby, deadline)
+            pending.update(isects)
+            if next_isects is None:
+                break
+
+            held = pending | next_isects
+            if self.memory_budget is not None and sum(map(_group_bytes, held)) > self.memory_budget:
+                self.limit = "memory"
+                pending = held
+                break
+
+            final = _uncovered(pending, next_isects)
+            pending -= final
+            yield from _select(final)
+            isects = next_isects
+
+        yield from _select(pending)
+
+    def _generation(self, pairs, work, nearby, deadline):
+        """
+        Intersect each group with its list of other groups, and split the results.
+        :return: A set of new groups, or None when out of time.
+        """
+        next_isects = set()
+        for a, others in pairs:
+            if deadline is not None and time.monotonic() > deadline:
+                self.limit = "time"
+                return None
+            if a.size < self.min_size:
+                continue
+            for b in others:
+                next_isects.update(work.intersect(a, b, nearby))
+        if self.max_order is not None:
+            too_large = {c for c in next_isects if c.order > self.max_order}
+            if too_large:
+                self.limit = "order"
+                next_isects -= too_large
+        return {c for c in next_isects if c.size >= self.min_size}
+
+
+def _group_bytes(group):
+    return sys.getsizeof(group) + sys.getsizeof(group.positions) + sys.getsizeof(group.pattern) \
+        + len(group.pattern) * 64 + len(group.positions) * 28
+
 
+def _uncovered(groups, frontier):
+    """
+    Return the groups which no group found from the frontier onwards can contain.
+
+    A later group has some of the positions of a frontier group, moved left when the frontier group's pattern ends
+    up on the right of the new pattern. So a group can still be contained if its positions, moved right by some
+    amount, are all positions of one frontier group.
+    """
+    by_gap = defaultdict(list)
+    for f in frontier:
+        positions = set(f.positions)
+        for x, y in itertools.combinations(f.positions, 2):
+            by_gap[y - x].append((x, positions))
+
+    def covered(g):
+        first, second = g.positions[:2]
+        for x, positions in by_gap[second - first]:
+            shift = x - first
+            if shift >= 0 and all(p + shift in positions for p in g.positions[2:]):
+                return True
+        return False
+
+    return {g for g in groups if not covered(g)}
+
+
+def _select(groups):
+    """
+    Return the non-accidental groups which are not contained in another group.
+    Groups can only contain groups with the same positions, and those become final together.
+    """
     # Only non-accidental isomorphs, please
-    result = set([g for g in result if g.order > 2 or g.size > 2])
-    rejects = []
-    for group1, group2 in itertools.combinations(result, 2):
-        if group1.contains(group2):
-            rejects.append(group2)
-        if group2.contains(group1):
-            rejects.append(group1)
+    by_positions = defaultdict(list)
+    for g in groups:
+        if g.order > 2 or g.size > 2:
+            by_positions[g.positions].append(g)
+    return [g for same in by_positions.values() for g in same
+            if not any(other is not g and other.contains(g) for other in same)]
 
-    return [g for g in result if g not in rejects]
+
+@cache.cached(version=1, params=("NEARBY", "MAX_DISTANCE"))
+def find_isomorphs(msg) -> List[IsomorphGroup]:
+    return list(IsomorphSearch(msg))
+
+
+def sweep_isomorphs(msg, nearby_values=(NEARBY,), max_distance_values=(MAX_DISTANCE,)):
+    """
+    The same as find_isomorphs with NEARBY and MAX_DISTANCE set to each combination of the values, sharing the
+    occurrence table, the initial groups, the intersections and the splits between the searches.
+    :return: {(nearby, max_distance): [IsomorphGroup, ...]}
+    """
+    work = SearchWork(msg)
+    return {(nearby, max_distance): list(IsomorphSearch(msg, nearby=nearby, max_distance=max_distance, work=work))
+            for nearby in nearby_values for max_distance in max_distance_values}
+
+
+def format_sweep(counts):
+    """
+    :param counts: {(nearby, max_distance): Counter of (order, size)}
+    :return: Table of the number of isomorphs by (order) and [group size] for each setting
+    """
+    keys = sorted(set(key for c in counts.values() for key in c))
+    lines = ["Isomorphs by (order) and [group size]:",
+             " " * 14 + "".join(f"  N={nearby:<2} D={max_distance:<2}" for nearby, max_distance in counts)]
+    for order, size in keys:
+        lines.append(f"    ({order:2})[{size:2}]: " + "".join(f"{c[order, size]:>12}" for c in counts.values()))
+    lines.append(f"{'Total':>14}" + "".join(f"{sum(c.values()):>12}" for c in counts.values()))
+    return '\n'.join(lines)
 
 
 def get_color(obj):
@@ -408,32 +661,278 @@ def format_isomorphs(isomorphs: List[IsomorphGroup], msg):
     return '\n\n'.join(output_chunks)
 
 
+def random_messages(trials, length, alphabet=len(Runic.rune_alphabet), rng=None):
+    """
+    :return: (trials, length) array of uniformly random letters, coded as integers
+    """
+    return np.random.default_rng(rng).integers(alphabet, size=(trials, length))
+
+
+def _batch_occurrences(msgs):
+    """
+    :return: (gaps, prev) arrays for a batch of messages. gaps[b, i] is the distance from msgs[b, i] to the next
+        occurrence of the same letter, or 0. prev[b, i] is as in Occurrences.
+    """
+    rows = np.arange(len(msgs))[:, None]
+    order = np.argsort(msgs, axis=1, kind="stable")
+    same = np.take_along_axis(msgs, order[:, 1:], 1) == np.take_along_axis(msgs, order[:, :-1], 1)
+    gaps = np.zeros(msgs.shape, dtype=np.int64)
+    gaps[rows, order[:, :-1]] = np.where(same, order[:, 1:] - order[:, :-1], 0)
+    prev = np.full(msgs.shape, -1)
+    prev[rows, order[:, 1:]] = np.where(same, order[:, :-1], -1)
+    return gaps, prev
+
+
+def _window_pairs(prev, message, start, width):
+    """
+    Occurrences.window for a batch of messages: one row for each message and window start, holding the size of the
+    pair which ends at each offset of the window, or 0.
+    """
+    n = prev.shape[1]
+    rows = np.arange(len(start))
+    paired = np.zeros((len(start), width), dtype=bool)
+    pairs = np.zeros((len(start), width), dtype=np.int64)
+    for j in range(width):
+        offset = prev[message, np.minimum(start + j, n - 1)] - start
+        ok = (start + j < n) & (offset >= 0)
+        ok[ok] = ~paired[rows[ok], offset[ok]]
+        paired[:, j] = ok
+        pairs[:, j] = np.where(ok, j - offset, 0)
+    return pairs
+
+
+class _BatchGroups:
+    """
+    Isomorph groups of a batch of messages as arrays, one row per group.
+
+    pattern[g, end] is the size of the pair of the group's pattern which ends at that offset, or 0. A pattern always
+    starts at offset 0, and a position has at most one pair of repeated letters ending at each offset, so this is the
+    same as IsomorphGroup.pattern. The positions of all groups are in one array, along with the group of each.
+    Groups are identified by their message, their pattern, and a hash of their positions.
+    """
+
+    def __init__(self, message, pattern, member_group, member_position, position_hash):
+        self.message = message
+        self.pattern = pattern
+        self.member_group = member_group
+        self.member_position = member_position
+        self.max_offset = np.max(np.where(pattern > 0, np.arange(pattern.shape[1]), 0), 1)
+        self.order = np.count_nonzero(pattern, 1)
+        self.size = np.bincount(member_group, minlength=len(message))
+        self.hash = np.zeros(len(message), dtype=np.uint64)
+        np.add.at(self.hash, member_group, position_hash[member_position])
+
+    def __len__(self):
+        return len(self.message)
+
+    def keys(self):
+        """
+        :return: One row per group: message, position hash, size, and pattern. Groups have the same positions
+            when the first three are the same.
+        """
+        return np.column_stack((self.message, self.hash.view(np.int64), self.size, self.pattern))
+
+    def take(self, keep):
+        """
+        :return: The groups where keep is True
+        """
+        index = np.full(len(self), -1)
+        index[keep] = np.arange(np.count_nonzero(keep))
+        members = keep[self.member_group]
+        groups = _BatchGroups.__new__(_BatchGroups)
+        groups.message = self.message[keep]
+        groups.pattern = self.pattern[keep]
+        groups.member_group = index[self.member_group[members]]
+        groups.member_position = self.member_position[members]
+        groups.max_offset = self.max_offset[keep]
+        groups.order = self.order[keep]
+        groups.size = self.size[keep]
+        groups.hash = self.hash[keep]
+        return groups
+
+    def unique(self):
+        """
+        :return: The groups with duplicates removed
+        """
+        _, first = np.unique(self.keys()[:, :4 + self.max_offset.max(initial=0)], axis=0, return_index=True)
+        keep = np.zeros(len(self), dtype=bool)
+        keep[first] = True
+        return self.take(keep)
+
+
+def _batch_generation(frontier, gaps, prev, position_hash, nearby, max_distance, first):
+    """
+    IsomorphSearch._generation for a batch: intersect every frontier group with every initial group, and split
+    the results. The first generation is the initial groups intersected with the larger initial groups.
+    """
+    width = frontier.pattern.shape[1]
+    n = gaps.shape[1]
+    member = np.arange(len(frontier.member_position))
+    group = frontier.member_group
+    message = frontier.message[group]
+    max_offset = frontier.max_offset[group]
+
+    # Every (member, dist, size) where the initial group of that size has a position dist from the member
+    found = []
+    for dist in range(-(max_distance + nearby), frontier.max_offset.max() + nearby + 1):
+        q = frontier.member_position + dist
+        ok = (q >= 0) & (q < n) & (dist <= max_offset + nearby)
+        size = np.zeros(len(q), dtype=np.int64)
+        size[ok] = gaps[message[ok], q[ok]]
+        ok &= (size > 0) & (size <= max_distance) & (dist >= -size - nearby)
+        if dist >= 0:
+            end = np.minimum(dist + size, width - 1)
+            ok &= (dist + size >= width) | (frontier.pattern[group, end] != size)
+        if first:
+            ok &= size != max_offset
+        found.append((member[ok], np.full(np.count_nonzero(ok), dist), size[ok]))
+    member, dist, size = (np.concatenate(a) for a in zip(*found))
+
+    # Intersections need at least two positions at the same distance
+    isect = (group[member] * (width + max_distance + 2 * nearby) + dist + max_distance + nearby) \
+        * (max_distance + 1) + size
+    keep = np.bincount(isect)[isect] > 1
+    member, dist, size, isect = member[keep], dist[keep], size[keep], isect[keep]
+
+    group = group[member]
+    message = frontier.message[group]
+    shift = np.maximum(-dist, 0)
+    position = frontier.member_position[member] - shift
+    columns = np.arange(width)
+    source = columns - shift[:, None]
+    pattern = np.where(source >= 0, frontier.pattern[group[:, None], np.maximum(source, 0)], 0)
+    pattern[np.arange(len(group)), np.maximum(dist, 0) + size] = size
+    new_max_offset = np.maximum(frontier.max_offset[group] + shift, np.maximum(dist, 0) + size)
+
+    # split_enclosing: add the pairs in each position's window which are not in the pattern yet
+    window = new_max_offset.max(initial=0)
+    row = np.zeros(pattern.shape, dtype=np.int64)
+    row[:, :window] = _window_pairs(prev, message, position, window)
+    row[(columns >= new_max_offset[:, None]) | (row == pattern)] = 0
+    pattern = np.where(row > 0, row, pattern)
+
+    _, split, counts = np.unique(np.column_stack((isect, pattern[:, :window + 1])), axis=0, return_inverse=True,
+                                 return_counts=True)
+    split = split.ravel()
+    keep = counts[split] > 1
+    split, message, pattern, position = split[keep], message[keep], pattern[keep], position[keep]
+    _, first_member, member_group = np.unique(split, return_index=True, return_inverse=True)
+    return _BatchGroups(message[first_member], pattern[first_member], member_group.ravel(), position,
+                        position_hash).unique()
+
+
+def count_isomorphs(msgs, max_order=4, nearby=None, max_distance=None, rng=None):
+    """
+    Count the isomorphs find_isomorphs finds in each of a batch of messages of the same length.
+
+    The search runs generation by generation on all messages at once, with every group of every message in the same
+    arrays. Messages with groups of a higher order than max_order are searched again with IsomorphSearch instead.
+
+    :param msgs: (messages, length) array of letters
+    :param nearby: Defaults to NEARBY
+    :param max_distance: Defaults to MAX_DISTANCE
+    :param rng: Seed for the hashes of group positions
+    :return: Counter of (order, size) over all the messages
+    """
+    nearby = NEARBY if nearby is None else nearby
+    max_distance = MAX_DISTANCE if max_distance is None else max_distance
+    msgs = np.asarray(msgs)
+    count, n = msgs.shape
+    width = max_distance + max_order * (max_distance + nearby) + 1
+    gaps, prev = _batch_occurrences(msgs)
+    position_hash = np.random.default_rng(rng).integers(np.iinfo(np.uint64).max, size=n, dtype=np.uint64)
+
+    # Initial groups, as get_initial_groups: one for each message and size
+    message, position = np.nonzero((gaps > 0) & (gaps <= max_distance))
+    size = gaps[message, position]
+    initial, member_group = np.unique(message * (max_distance + 1) + size, return_inverse=True)
+    pattern = np.zeros((len(initial), width), dtype=np.int64)
+    pattern[np.arange(len(initial)), initial % (max_distance + 1)] = initial % (max_distance + 1)
+    frontier = _BatchGroups(initial // (max_distance + 1), pattern, member_group.ravel(), position, position_hash)
+
+    fallback = np.zeros(count, dtype=bool)
+    found = [np.zeros((0, width + 3), dtype=np.int64)]
+    first = True
+    while len(frontier):
+        frontier = _batch_generation(frontier, gaps, prev, position_hash, nearby, max_distance, first)
+        first = False
+        fallback[frontier.message[frontier.order > max_order]] = True
+        frontier = frontier.take(~fallback[frontier.message])
+        found.append(frontier.keys())
+
+    # _select: only non-accidental groups which no other group with the same positions contains
+    keys = np.concatenate(found)
+    keys = np.unique(keys[~fallback[keys[:, 0]]], axis=0)
+    size = keys[:, 2]
+    pattern = keys[:, 3:]
+    order = np.count_nonzero(pattern, 1)
+    keep = (order > 2) | (size > 2)
+    keys, pattern, order, size = keys[keep], pattern[keep], order[keep], size[keep]
+
+    # Groups with the same positions are next to each other. There are few of them.
+    same = np.flatnonzero(np.all(keys[1:, :3] == keys[:-1, :3], 1))
+    contained = np.zeros(len(keys), dtype=bool)
+    for start, stop in _runs(same):
+        for i in range(start, stop + 1):
+            contained[i] = any(j != i and np.all((pattern[i] == 0) | (pattern[i] == pattern[j]))
+                               for j in range(start, stop + 1))
+
+    counts = Counter(zip(order[~contained].tolist(), size[~contained].tolist()))
+    for b in np.flatnonzero(fallback):
+        search = IsomorphSearch(msgs[b].tolist(), nearby=nearby, max_distance=max_distance)
+        counts.update((iso.order, iso.size) for iso in search)
+    return counts
+
+
+def _runs(same):
+    """
+    :param same: Sorted indexes i where row i + 1 equals row i
+    :return: [first, last] rows of each run of equal rows
+    """
+    runs = []
+    for i in same.tolist():
+        if runs and runs[-1][1] == i:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    return runs
+
+
 def monte_carlo_main():
     with open("liber-primus__transcription--master.txt", encoding='utf8') as f:
         liber_raw = ''.join(f.readlines()[9:])
     liber_segments = liber_raw.split(Break.SEGMENT)[7:-3]
     print(len(liber_segments))
     seg_lengths = [len([a for a in seg if a in Runic.rune_alphabet]) for seg in liber_segments]
-    order_size_key = lambda a: (a.order, a.size)
 
     trial_count = 1000
+    batch_size = 100
+    rng = np.random.default_rng()
     trial_results = {}
 
     for length in seg_lengths:
-        trials = defaultdict(list)
+        counts = Counter()
+        for start in range(0, trial_count, batch_size):
+            msgs = random_messages(min(batch_size, trial_count - start), length, rng=rng)
+            counts.update(count_isomorphs(msgs, rng=rng))
 
-        for _ in range(trial_count):
-            msg = random.choices(Runic.rune_alphabet, k=length)
-            isomorphs = find_isomorphs(msg)
+        trial_results[length] = {(order, size): counts[order, size] / trial_count
+                                 for order, size in sorted(counts.keys())}
 
-            for (order, size), morphs in itertools.groupby(
-                    sorted(isomorphs, key=order_size_key), key=order_size_key):
-                trials[order, size].append(len(list(morphs)))
+    pprint(trial_results)
 
-        trial_results[length] = {(order, size): sum(trials[order, size]) / trial_count
-                                 for order, size in sorted(trials.keys())}
 
-    pprint(trial_results)
+def sweep_main():
+    with open("liber-primus__transcription--master.txt", encoding='utf8') as f:
+        liber_raw = ''.join(f.readlines()[9:])
+    liber_segments = liber_raw.split(Break.SEGMENT)[7:-3]
+
+    counts = defaultdict(Counter)
+    for liber_section in liber_segments:
+        msg_cleaned = [m for m in liber_section if m in Runic.rune_alphabet]
+        for setting, isomorphs in sweep_isomorphs(msg_cleaned, range(1, 6), range(4, 9)).items():
+            counts[setting].update((iso.order, iso.size) for iso in isomorphs)
+    print(format_sweep(counts))
 
 
 monte_carlo_results = {
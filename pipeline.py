@@ -0,0 +1,224 @@
+import hashlib
+import types
+from collections import OrderedDict
+
+import numpy as np
+
+# Message transform pipeline
+#
+# Builds variant corpora (decrypted, reversed, differenced, headers cut off, ...) as chains of lazily
+# evaluated stages. Nothing is computed until a node's messages are requested. Iterating a node which isn't
+# memoized yet pulls messages through the chain one at a time, so every stage is a generator over its
+# parent's output. A node's output is memoized under the transform chain plus the hash of the base corpus
+# once it has all been computed, so variants that share a prefix of the chain only compute that prefix once.
+# The memo keeps the memo_size most recently used nodes' messages.
+#
+# A node iterates like a list of messages, so it can be passed to anything that takes one:
+#
+#     base = Corpus(eye_messages)
+#     repeats.find_repeats(base.trim(25).difference(4))
+#     isomorphs.find_isomorphs(base.reverse()[3])
+#     stat_period.coincidence_rates(base.trim(25))
+
+memo_size = 128
+
+_memo = OrderedDict()
+
+
+def corpus_hash(msgs):
+    """
+    Hash the contents of a list of messages. Messages can be numpy arrays or any sequence numpy can
+    turn into an array, such as lists of rune strings.
+    """
+    h = hashlib.sha1()
+    for m in msgs:
+        a = np.asarray(m)
+        h.update(f"{a.dtype.str}{a.shape}".encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+
+def update_hash(h, arg):
+    """
+    Add arg to the hash h, by contents for arrays, containers and code, and by transform chain for nodes.
+    """
+    if isinstance(arg, Node):
+        h.update(repr(arg.key).encode())
+    elif isinstance(arg, np.ndarray):
+        h.update(f"array{arg.dtype.str}{arg.shape}".encode())
+        h.update(np.ascontiguousarray(arg).tobytes())
+    elif isinstance(arg, (list, tuple)):
+        h.update(f"{type(arg).__name__}{len(arg)}(".encode())
+        for a in arg:
+            update_hash(h, a)
+        h.update(b")")
+    elif isinstance(arg, (set, frozenset)):
+        h.update(f"{type(arg).__name__}{len(arg)}(".encode())
+        for a in sorted(arg, key=repr):
+            update_hash(h, a)
+        h.update(b")")
+    elif isinstance(arg, dict):
+        h.update(f"dict{len(arg)}(".encode())
+        for k in sorted(arg, key=repr):
+            update_hash(h, k)
+            update_hash(h, arg[k])
+        h.update(b")")
+    elif isinstance(arg, types.CodeType):
+        h.update(b"code(")
+        h.update(arg.co_code)
+        update_hash(h, arg.co_consts)
+        update_hash(h, arg.co_names)
+        h.update(b")")
+    else:
+        h.update(repr(arg).encode())
+        h.update(b";")
+
+
+def _hashable(arg):
+    """
+    :return: arg if it can be part of a memo key, otherwise a hash of its contents, such as for lists and arrays
+    """
+    try:
+        hash(arg)
+        return arg
+    except TypeError:
+        h = hashlib.sha1()
+        update_hash(h, arg)
+        return f"{type(arg).__name__}:{h.hexdigest()}"
+
+
+def _code_digest(func):
+    """
+    :return: A hash of func's compiled code, so editing a transform changes the keys of its nodes, or None for
+        callables without Python code
+    """
+    code = getattr(func, "__code__", None)
+    if code is None:
+        return None
+    h = hashlib.sha1()
+    update_hash(h, code)
+    return h.hexdigest()
+
+
+def _remember(key, msgs):
+    _memo[key] = msgs
+    while len(_memo) > memo_size:
+        _memo.popitem(last=False)
+
+
+def clear_memo():
+    _memo.clear()
+
+
+def _reverse(m):
+    return m[::-1]
+
+
+def _trim(m, start, stop):
+    return m[start:stop]
+
+
+def _difference(m, k, modulus):
+    # Same as autokey_decrypt.decrypt, with the key size as a parameter
+    return (m[k:] - m[:-k]) % modulus
+
+
+class Node:
+    """
+    One stage of a transform chain. Transforms are applied to each message of the parent node.
+
+    A node is identified by its key: the base corpus hash followed by one (name, code, *args) entry per stage.
+    The name stands in for the transform function in the key, so it must be unique per function, and code is
+    a hash of the function's code, so results of an edited function aren't mistaken for the old ones. Arguments
+    which can't be hashed, such as lists and arrays, are in the key as a hash of their contents.
+    """
+
+    def __init__(self, parent, func, args, name):
+        self.parent = parent
+        self.func = func
+        self.args = args
+        self.key = parent.key + ((name, _code_digest(func)) + tuple(_hashable(arg) for arg in args),)
+
+    def __iter__(self):
+        msgs = _memo.get(self.key)
+        if msgs is not None:
+            _memo.move_to_end(self.key)
+            return iter(msgs)
+        return self._stream_and_remember()
+
+    def __len__(self):
+        return len(self.messages())
+
+    def __getitem__(self, item):
+        return self.messages()[item]
+
+    def __repr__(self):
+        return f"Node({' -> '.join(str((stage[0],) + stage[2:]) for stage in self.key[1:])})"
+
+    def stream(self):
+        """
+        Generate this stage's messages as the parent generates its own, or from its memoized messages.
+        """
+        for m in self.parent:
+            yield self.func(m, *self.args)
+
+    def _stream_and_remember(self):
+        msgs = []
+        for m in self.stream():
+            msgs.append(m)
+            yield m
+        _remember(self.key, msgs)
+
+    def messages(self):
+        msgs = _memo.get(self.key)
+        if msgs is None:
+            msgs = list(self.stream())
+            _remember(self.key, msgs)
+        else:
+            _memo.move_to_end(self.key)
+        return msgs
+
+    def then(self, func, *args, name=None):
+        """
+        Add a stage applying func(message, *args) to every message.
+
+        :param name: Identifies func in the memo key. Defaults to its qualified name, which is only unique for
+            module-level functions, so lambdas and nested functions need one.
+        """
+        if name is None:
+            name = f"{func.__module__}.{func.__qualname__}"
+            if "<lambda>" in name or "<locals>" in name:
+                raise ValueError(f"{name} has no unique name, so it needs a name for the memo key")
+        return Node(self, func, args, name)
+
+    def reverse(self):
+        return self.then(_reverse, name="reverse")
+
+    def trim(self, start=0, stop=None):
+        return self.then(_trim, start, stop, name="trim")
+
+    def difference(self, k=1, modulus=83):
+        return self.then(_difference, k, modulus, name="difference")
+
+
+class Corpus(Node):
+    """
+    The root of a transform chain.
+    """
+
+    def __init__(self, msgs):
+        self.parent = None
+        self._msgs = list(msgs)
+        self.key = (corpus_hash(self._msgs),)
+
+    def __repr__(self):
+        return f"Corpus({self.key[0][:8]}, {len(self._msgs)} messages)"
+
+    def __iter__(self):
+        return iter(self._msgs)
+
+    def stream(self):
+        yield from self._msgs
+
+    def messages(self):
+        return self._msgs
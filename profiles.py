@@ -0,0 +1,65 @@
+# Rolling-window profiles
+#
+# Computes the rate of coincidence within a window sliding along each message (the phi test), and between each pair
+# of messages within a window sliding along both (the kappa test). The profiles are 2D arrays with one row for each
+# message or pair of messages and one column for each window start, padded with NaN where a message is too short.
+#
+# Displays both in a matplotlib window, where the places messages change behavior, such as the end of the shared
+# headers, stand out.
+
+import itertools
+
+import numpy as np
+from matplotlib import pyplot as plt
+
+from data import eye_messages
+from tests import kappa_profile, phi_profile
+
+window = 25
+
+
+def _stack(rows):
+    profiles = np.full((len(rows), max((len(r) for r in rows), default=0)), np.nan)
+    for i, r in enumerate(rows):
+        profiles[i, :len(r)] = r
+    return profiles
+
+
+def phi_profiles(msgs=eye_messages, window=window):
+    rates = []
+    for m in msgs:
+        matches, checks = phi_profile(m, window)
+        rates.append(matches / checks)
+    return _stack(rates)
+
+
+def kappa_profiles(msgs=eye_messages, window=window, width=0):
+    """
+    :return: The list of message pairs (i, j), and the profile of each pair
+    """
+    pairs = list(itertools.combinations(range(len(msgs)), 2))
+    rates = []
+    for i, j in pairs:
+        matches, checks = kappa_profile(msgs[i], msgs[j], window, width)
+        rates.append(matches / checks)
+    return pairs, _stack(rates)
+
+
+def main():
+    phi = phi_profiles()
+    pairs, kappa = kappa_profiles()
+
+    fig, (ax1, ax2) = plt.subplots(2, 1, sharex=True)
+    for i, row in enumerate(phi):
+        ax1.plot(1000 * row, label=f"{i}")
+    ax1.set_ylabel(f"Coincidences per 1000\n(within {window} letters)")
+    ax1.legend(ncol=3)
+    for (i, j), row in zip(pairs, kappa):
+        ax2.plot(1000 * row, label=f"{i}-{j}")
+    ax2.set_ylabel(f"Coincidences per 1000\n(between {window} letters)")
+    ax2.set_xlabel("Window start")
+    plt.show()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,16 @@
+import itertools
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
+
+import cache
 from data import eye_messages
 
 max_size = 25
 
+simulation_trials = 1000
+
 
 # Kasiski Analysis, kind of.
 #
@@ -16,6 +23,7 @@ max_size = 25
 # Rewrites or refactors are welcome.
 
 
+@cache.cached(version=1, params=("max_size",))
 def find_repeats(msgs=eye_messages):
     # Keys in repeats are bytestrings, so we can use 'in' to check for substrings
     # Values in repeats are sets of positions, so we can easily discard repeats at the same position.
@@ -45,16 +53,199 @@ def find_repeats(msgs=eye_messages):
     return ret
 
 
+def find_approximate_repeats(msgs=eye_messages, mismatches=1, min_size=6):
+    """
+    Find repeats of at least min_size letters where the occurrences differ in up to `mismatches` letters.
+
+    Seed and extend: a repeat of min_size letters with k mismatches, split into k+1 blocks, has at least one
+    block of min_size // (k+1) letters which repeats exactly. Exact repeats of that seed length are found by
+    hashing. The diagonal of each seed repeat (the pair of messages and the distance between the occurrences)
+    is then compared once in full, and every maximal stretch with at most k mismatches is reported.
+
+    Keys are tuples of letters with None at the mismatched offsets. Values are sets of positions, as in
+    find_repeats.
+    """
+    seed_size = min_size // (mismatches + 1)
+    if seed_size < 1:
+        raise ValueError("min_size must be larger than the number of mismatches")
+
+    seeds = defaultdict(list)
+    for msgnum, m in enumerate(msgs):
+        for pos in range(len(m) - seed_size + 1):
+            seeds[bytes(tuple(m[pos:pos + seed_size]))].append((msgnum, pos))
+
+    repeats = defaultdict(set)
+    diagonals = set()
+    for occurrences in seeds.values():
+        for (msg1, pos1), (msg2, pos2) in itertools.combinations(occurrences, 2):
+            diagonal = (msg1, msg2, pos2 - pos1)
+            if diagonal in diagonals:
+                continue
+            diagonals.add(diagonal)
+
+            m1 = np.asarray(msgs[msg1])
+            m2 = np.asarray(msgs[msg2])
+            start1 = pos1 - min(pos1, pos2)
+            start2 = pos2 - min(pos1, pos2)
+            length = min(len(m1) - start1, len(m2) - start2)
+            a = m1[start1:start1 + length]
+            different = a != m2[start2:start2 + length]
+
+            # Between each mismatch and the (k+1)th mismatch after it lies a maximal stretch with k mismatches
+            bounds = np.concatenate(([-1], np.flatnonzero(different), [length]))
+            for i in range(max(len(bounds) - mismatches - 1, 1)):
+                start = bounds[i] + 1
+                end = bounds[min(i + mismatches + 1, len(bounds) - 1)]
+                # Don't start or end a repeat with a mismatch
+                while start < end and different[start]:
+                    start += 1
+                while end > start and different[end - 1]:
+                    end -= 1
+                if end - start < min_size:
+                    continue
+                key = tuple(None if d else int(c) for c, d in zip(a[start:end], different[start:end]))
+                repeats[key].update((int(start1 + start), int(start2 + start)))
+
+    # As in find_repeats, repeats at the same position of different messages count as one position
+    return {key: positions for key, positions in repeats.items() if len(positions) > 1}
+
+
+def isomorph_pattern(letters):
+    """
+    The pattern of repeated letters in a string, written like IsomorphGroup.pattern_string: letters which
+    occur once are '_', and repeated letters are named A, B, C... in order of their first appearance.
+    """
+    counts = Counter(letters)
+    names = {}
+    pattern = []
+    for letter in letters:
+        if counts[letter] == 1:
+            pattern.append('_')
+        else:
+            if letter not in names:
+                names[letter] = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[len(names)]
+            pattern.append(names[letter])
+    return tuple(pattern)
+
+
+def find_isomorphic_repeats(msgs=eye_messages, min_size=4, min_repeats=2):
+    """
+    Find strings that repeat with the same pattern of repeated letters, but not necessarily the same letters.
+
+    Each letter is encoded as its distance to the previous occurrence of the same letter, or 0 if that occurrence
+    lies outside the string. Two strings are isomorphic exactly when their encodings are equal, and the encoding
+    of a string is a prefix of the encoding of each longer string it starts, so the windows of each size are
+    hashed in one pass from the hashes of the size before.
+
+    Keys are isomorph_pattern tuples, values are sets of positions, as in find_repeats. Only strings which
+    start and end with a repeated letter, and which have at least min_repeats letters repeating an earlier
+    letter, are returned.
+    """
+    prev = []
+    starts = []
+    remaining = []
+    for m in msgs:
+        last = {}
+        for i, letter in enumerate(m):
+            prev.append(i - last[letter] if letter in last else 0)
+            last[letter] = i
+            starts.append(i)
+            remaining.append(len(m) - i)
+    prev = np.array(prev, dtype=np.uint64)
+    starts = np.array(starts)
+    remaining = np.array(remaining)
+    index = np.arange(len(prev))
+
+    # Distance from each letter to the next occurrence of the same letter
+    following = np.zeros_like(prev)
+    repeated = np.flatnonzero(prev)
+    following[repeated - prev[repeated].astype(np.int64)] = prev[repeated]
+
+    hashes = np.zeros(len(prev), dtype=np.uint64)
+    links = np.zeros(len(prev), dtype=np.int64)
+    # One {hash: [first index, prefix hash, positions, reportable]} for each size from min_size
+    layers = []
+    for size in range(1, max_size):
+        code = prev[np.minimum(index + size - 1, len(prev) - 1)]
+        code = np.where(code < size, code, 0)
+        prefix = hashes
+        hashes = hashes * np.uint64(1000003) + code + np.uint64(1)
+        links = links + (code > 0)
+        if size < min_size:
+            continue
+
+        valid = (remaining >= size) & (links >= min_repeats)
+        reportable = (code > 0) & (following > 0) & (following < size)
+        layer = {}
+        for h, p, i, r in zip(hashes[valid].tolist(), prefix[valid].tolist(), index[valid].tolist(),
+                              reportable[valid].tolist()):
+            if h not in layer:
+                layer[h] = [i, p, set(), r]
+            layer[h][2].add(int(starts[i]))
+        layers.append(layer)
+
+    # As in find_repeats, drop a repeat if a longer one has the same positions. Strings which aren't
+    # reportable themselves pass that on to their prefixes, so the longest reportable string is kept.
+    letters = [letter for m in msgs for letter in m]
+    ret = {}
+    superseded = set()
+    for size in reversed(range(min_size, max_size)):
+        layer = layers[size - min_size]
+        shorter = layers[size - min_size - 1] if size > min_size else {}
+        next_superseded = set()
+        for h, (first, prefix, positions, reportable) in layer.items():
+            if len(positions) < 2:
+                continue
+            if (reportable or h in superseded) and prefix in shorter \
+                    and len(shorter[prefix][2]) == len(positions):
+                next_superseded.add(prefix)
+            if reportable and h not in superseded:
+                ret[isomorph_pattern(letters[first:first + size])] = positions
+        superseded = next_superseded
+
+    return ret
+
+
 def output_html(repeats, msgs=eye_messages, output_filename="docs/repeats_out.html"):
+    """
+    Write the messages with each repeat underlined. Accepts the output of find_repeats,
+    find_approximate_repeats or find_isomorphic_repeats. Mismatched letters of approximate repeats are
+    written in italics.
+    """
+    wildcards = {key: positions for key, positions in repeats.items() if None in key}
+    patterns = {key: positions for key, positions in repeats.items() if key and isinstance(key[0], str)}
+
+    def match(m, i):
+        # Returns the length of the longest repeat at m[i:], and the offsets of its mismatched letters
+        for j in reversed(range(0, 8)):
+            if tuple(m[i:i + j]) in repeats:
+                best = j, ()
+                break
+        else:
+            best = 0, ()
+        for key, positions in wildcards.items():
+            if len(key) > best[0] and i in positions and len(m) - i >= len(key) \
+                    and all(k is None or k == c for k, c in zip(key, m[i:i + len(key)])):
+                best = len(key), tuple(offset for offset, k in enumerate(key) if k is None)
+        if patterns:
+            for j in reversed(range(best[0] + 1, min(max_size, len(m) - i + 1))):
+                if i in patterns.get(isomorph_pattern(m[i:i + j]), ()):
+                    best = j, ()
+                    break
+        return best
+
     class _output:
         x = 0
         s = ""
 
-        def __call__(self, letters, underline=False):
+        def __call__(self, letters, underline=False, mismatches=()):
             if underline:
                 self.s += "<u>"
             for i, c in enumerate(letters):
-                self.s += f"{c:02}"
+                if i in mismatches:
+                    self.s += f"<i>{c:02}</i>"
+                else:
+                    self.s += f"{c:02}"
                 if underline and i == len(letters) - 1:
                     self.s += "</u>"
                 self.s += " "
@@ -71,11 +262,10 @@ def output_html(repeats, msgs=eye_messages, output_filename="docs/repeats_out.ht
         i = 0
         output.s += " " * 39 + f"{msgnum}\n"
         while i < len(m):
-            for j in reversed(range(0, 8)):
-                if tuple(m[i:i + j]) in repeats:
-                    output(m[i:i + j], True)
-                    i += j
-                    break
+            j, mismatches = match(m, i)
+            if j:
+                output(m[i:i + j], True, mismatches)
+                i += j
             else:
                 output(m[i:i + 1])
                 i += 1
@@ -85,14 +275,119 @@ def output_html(repeats, msgs=eye_messages, output_filename="docs/repeats_out.ht
         f.write("<html><body><pre>" + output.s + "</pre></body></html>")
 
 
-def print_stats(repeats):
+def count_repeats(corpora, lengths):
+    """
+    Count the repeats find_repeats would find in each of a batch of corpora, the way print_stats counts them.
+
+    A repeat which is a substring of a longer repeat with the same positions can only be its prefix, since
+    positions are where the strings start. So find_repeats keeps a string unless one letter longer has the
+    same number of positions. Here the strings of each size are rolling hashes over the whole batch, and
+    strings are grouped by sorting their hashes.
+
+    :param corpora: (trials, letters) array. Each row is the messages of one corpus, concatenated.
+    :param lengths: Message lengths
+    :return: (trials, max(lengths) + 1) array where [t, n] is the number of strings occurring n times in corpus t
+    """
+    corpora = np.asarray(corpora)
+    trials, total = corpora.shape
+    positions = np.concatenate([np.arange(length) for length in lengths])
+    remaining = np.concatenate([np.arange(length, 0, -1) for length in lengths])
+    letters = np.concatenate([corpora.astype(np.uint64) + 1, np.zeros((trials, max_size), dtype=np.uint64)], 1)
+    counts = np.zeros((trials, max(lengths) + 1), dtype=np.int64)
+
+    # Every corpus gets its own hashes
+    hashes = np.arange(1, trials + 1, dtype=np.uint64)[:, None] * np.uint64(0x9E3779B97F4A7C15) + letters[:, :total]
+    previous = None
+    # No string is longer than the longest message
+    for size in range(2, min(max_size, max(lengths) + 1)):
+        prefixes = hashes
+        hashes = hashes * np.uint64(1000003) + letters[:, size - 1:size - 1 + total]
+        valid = remaining >= size
+
+        h = hashes[:, valid].ravel()
+        p = np.tile(positions[valid], trials)
+        order = np.lexsort((p, h))
+        h = h[order]
+        p = p[order]
+        new_string = np.concatenate(([True], h[1:] != h[:-1]))
+        new_position = new_string | np.concatenate(([True], p[1:] != p[:-1]))
+        string_ids = np.cumsum(new_string) - 1
+        current = {
+            "hash": h[new_string],
+            "trial": np.repeat(np.arange(trials), valid.sum())[order][new_string],
+            "prefix": prefixes[:, valid].ravel()[order][new_string],
+            "count": np.bincount(string_ids, weights=new_position).astype(np.int64),
+        }
+
+        if previous is not None:
+            extended = current["count"] > 1
+            index = np.searchsorted(previous["hash"], current["prefix"][extended])
+            dropped = np.zeros(len(previous["hash"]), dtype=bool)
+            dropped[index[previous["count"][index] == current["count"][extended]]] = True
+            _add_counts(counts, previous, dropped)
+        previous = current
+    if previous is not None:
+        _add_counts(counts, previous, np.zeros(len(previous["hash"]), dtype=bool))
+    return counts
+
+
+def _add_counts(counts, strings, dropped):
+    keep = (strings["count"] > 1) & ~dropped
+    np.add.at(counts, (strings["trial"][keep], strings["count"][keep]), 1)
+
+
+def _simulate(lengths, trials, mode, letters, alphabet, seed):
+    rng = np.random.default_rng(seed)
+    total = sum(lengths)
+    if mode == "uniform":
+        corpora = rng.integers(0, alphabet, (trials, total))
+    elif mode == "frequency":
+        frequencies = np.bincount(letters, minlength=alphabet)
+        corpora = rng.choice(alphabet, (trials, total), p=frequencies / frequencies.sum())
+    elif mode == "shuffle":
+        corpora = rng.permuted(np.tile(letters, (trials, 1)), axis=1)
+    else:
+        raise ValueError(f"Unknown simulation mode {mode}")
+    return count_repeats(corpora, lengths)
+
+
+def simulate_repeat_counts(msgs=eye_messages, trials=None, mode="uniform", alphabet=83, batch_size=100,
+                           workers=None, seed=None):
+    """
+    Count repeats in random corpora with the same message lengths as msgs, on a process pool.
+
+    :param mode: "uniform" draws letters uniformly from the alphabet, "frequency" draws them with the letter
+        frequencies of msgs, and "shuffle" shuffles the letters of msgs across all messages.
+    :return: (trials, n) array as returned by count_repeats
+    """
+    trials = simulation_trials if trials is None else trials
+    lengths = [len(m) for m in msgs]
+    letters = np.concatenate([np.asarray(m) for m in msgs])
+    batches = [min(batch_size, trials - start) for start in range(0, trials, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batches))
+    with ProcessPoolExecutor(workers) as executor:
+        results = executor.map(_simulate, *zip(*[(lengths, batch, mode, letters, alphabet, s)
+                                                  for batch, s in zip(batches, seeds)]))
+        return np.concatenate(list(results))
+
+
+def print_stats(repeats, simulation=None):
+    """
+    :param simulation: Output of simulate_repeat_counts. If given, each count is followed by its expected value
+        and the probability of a count at least as high in the simulated corpora.
+    """
     sorted_repeats = sorted([(s, p) for s, p in repeats.items()], key=lambda a: -len(a[1]))
     repeat_counts = Counter()
     for string, positions in sorted_repeats:
         print(f"{string}: {sorted(positions)}")
         repeat_counts[len(positions)] += 1
     for n, c in repeat_counts.items():
-        print(f"{c} strings occur {n} times")
+        if simulation is None:
+            print(f"{c} strings occur {n} times")
+        else:
+            simulated = simulation[:, n] if n < simulation.shape[1] else np.zeros(len(simulation))
+            print(f"{c} strings occur {n} times "
+                  f"(expected {simulated.mean():.3f}, P(>= {c}) = {np.mean(simulated >= c):.4f})")
 
 
 def main():
@@ -100,7 +395,7 @@ def main():
 
     output_html(repeats)
 
-    print_stats(repeats)
+    print_stats(repeats, simulate_repeat_counts())
 
 
 if __name__ == '__main__':
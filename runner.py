@@ -0,0 +1,224 @@
+# Batch analysis of many corpora
+#
+# Runs the analyses below over every corpus file in a directory tree, on a process pool, and appends one JSON
+# record per corpus and analysis to a results file as soon as it is done:
+#
+#     {"corpus": "community/a.txt", "hash": "...", "analysis": "frequency", "seconds": 0.01, "result": {...}}
+#
+# The hash is of the bytes of the corpus file. A failed analysis writes an "error" instead of a "result", and
+# results which are not finite numbers are written as null. Analyses which already have a result for a corpus
+# with the same contents are skipped, so an interrupted run picks up where it stopped, after dropping any record
+# it was cut off in the middle of. The results file itself is never analysed, even if it is under the directory.
+#
+# A corpus file is one message per line, with the letters as integers separated by spaces or commas, or a .json
+# file holding a list of messages.
+#
+# Usage: python runner.py CORPUS_DIR RESULTS.jsonl [--workers N] [--analyses frequency,repeats,...]
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+import isomorphs
+import repeats
+import stat_period
+from tests import phi_test
+
+
+def frequency(msgs):
+    bins = np.bincount(np.concatenate(msgs), minlength=83)
+    matches, checks = phi_test(bins)
+    return {"letters": int(bins.sum()), "distinct": int(np.count_nonzero(bins)), "counts": bins.tolist(),
+            "phi": [int(matches), int(checks)]}
+
+
+def repeat_counts(msgs):
+    found = repeats.find_repeats.uncached(msgs)
+    by_size = Counter(len(key) for key in found)
+    return {"repeats": len(found), "by_size": {str(size): by_size[size] for size in sorted(by_size)}}
+
+
+def kappa_sweep(msgs):
+    return {"bounds": list(stat_period.bounds), "rates": stat_period.coincidence_rates.uncached(msgs)}
+
+
+def isomorph_counts(msgs):
+    counts = Counter()
+    for m in msgs:
+        counts.update((iso.order, iso.size) for iso in isomorphs.find_isomorphs.uncached(m.tolist()))
+    return [[order, size, counts[order, size]] for order, size in sorted(counts)]
+
+
+analyses = {
+    "frequency": frequency,
+    "repeats": repeat_counts,
+    "kappa": kappa_sweep,
+    "isomorphs": isomorph_counts,
+}
+
+
+def file_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def parse_corpus(data, path):
+    """
+    :param data: The bytes of a corpus file
+    :return: The messages of the corpus, as arrays
+    """
+    text = data.decode("utf8")
+    if path.endswith(".json"):
+        msgs = json.loads(text)
+    else:
+        lines = text.splitlines()
+        msgs = [[int(letter) for letter in re.split(r"[\s,]+", line.strip())] for line in lines if line.strip()]
+    return [np.array(m, dtype=np.int64) for m in msgs]
+
+
+def read_corpus(path):
+    """
+    :return: The messages of a corpus file, as arrays
+    """
+    with open(path, "rb") as f:
+        return parse_corpus(f.read(), path)
+
+
+def _finite(obj):
+    """
+    :return: obj with every float which is not finite replaced by None, so it can be written as strict JSON
+    """
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    return obj
+
+
+def find_corpora(directory, exclude=()):
+    """
+    :param exclude: Absolute paths of files to leave out
+    :return: The paths of the files under directory, relative to it, in a stable order
+    """
+    exclude = set(exclude)
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths.extend(os.path.relpath(os.path.join(root, name), directory) for name in sorted(files)
+                     if not name.startswith(".") and os.path.abspath(os.path.join(root, name)) not in exclude)
+    return paths
+
+
+def read_done(results_path):
+    """
+    :return: The (corpus, hash, analysis) of every result in the results file, and the length in bytes of its
+        complete lines. Anything after them is a line cut short when a run was interrupted.
+    """
+    done = set()
+    length = 0
+    try:
+        with open(results_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                length += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(record, dict) or "result" not in record:
+                    continue
+                key = (record.get("corpus"), record.get("hash"), record.get("analysis"))
+                if None not in key:
+                    done.add(key)
+    except FileNotFoundError:
+        pass
+    return done, length
+
+
+def run_analysis(directory, corpus, analysis):
+    """
+    Run one analysis of one corpus. Runs in a worker process.
+    :return: The record for the results file
+    """
+    start = time.perf_counter()
+    record = {"corpus": corpus, "hash": None, "analysis": analysis}
+    try:
+        path = os.path.join(directory, corpus)
+        with open(path, "rb") as f:
+            data = f.read()
+        record["hash"] = file_hash(data)
+        record["result"] = _finite(analyses[analysis](parse_corpus(data, path)))
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run(directory, results_path, names=tuple(analyses), workers=None):
+    """
+    Run the analyses over every corpus under directory which doesn't have its results yet, appending the records
+    to the results file as they complete. At most twice as many jobs as workers are queued at a time.
+
+    :return: The number of records written
+    """
+    done, length = read_done(results_path)
+    if os.path.exists(results_path) and os.path.getsize(results_path) > length:
+        with open(results_path, "r+b") as f:
+            f.truncate(length)
+    jobs = []
+    for corpus in find_corpora(directory, exclude=[os.path.abspath(results_path)]):
+        try:
+            with open(os.path.join(directory, corpus), "rb") as f:
+                digest = file_hash(f.read())
+        except OSError:
+            # Unreadable corpora get an error record from run_analysis
+            digest = None
+        jobs.extend((corpus, name) for name in names if (corpus, digest, name) not in done)
+
+    written = 0
+    limit = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(workers) as executor, open(results_path, "a", encoding="utf8") as out:
+        pending = set()
+        jobs = iter(jobs)
+        while True:
+            for corpus, name in jobs:
+                pending.add(executor.submit(run_analysis, directory, corpus, name))
+                if len(pending) >= limit:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                out.write(json.dumps(future.result(), allow_nan=False) + "\n")
+                written += 1
+            out.flush()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run analyses over a directory of corpora")
+    parser.add_argument("directory")
+    parser.add_argument("results")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--analyses", default=",".join(analyses))
+    args = parser.parse_args()
+    names = args.analyses.split(",")
+    unknown = [name for name in names if name not in analyses]
+    if unknown:
+        parser.error(f"unknown analyses: {', '.join(unknown)}")
+    written = run(args.directory, args.results, names, args.workers)
+    print(f"{written} records written to {args.results}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+# Material shared between messages
+#
+# The eye messages share long headers, and some agree for a while further on. Letters copied between messages
+# coincide in every superimposition test, so analyses which assume independent messages should leave them out.
+#
+# A prefix trie of the messages gives the exact point where each pair of messages diverges. A generalized suffix
+# automaton of the messages gives every substring they share, wherever it is. Both are built in time linear in
+# the total length of the messages, and look up a string in time linear in its length.
+#
+# Writes the divergence points, the longest shared substrings, and the superimposition test of the eye messages
+# with their shared prefixes left out to stdout.
+
+import numpy as np
+
+from data import eye_messages
+from tests import kappa_test
+
+min_length = 5
+
+
+class _TrieNode:
+    __slots__ = ("children", "messages")
+
+    def __init__(self):
+        self.children = {}
+        self.messages = set()
+
+
+class PrefixTrie:
+    """
+    Every node is a prefix of some messages, and keeps the set of them.
+    """
+
+    def __init__(self, msgs=()):
+        self.root = _TrieNode()
+        self.messages = []
+        for m in msgs:
+            self.add(m)
+
+    def add(self, msg):
+        """
+        :return: The index of the message
+        """
+        k = len(self.messages)
+        self.messages.append(msg)
+        node = self.root
+        node.messages.add(k)
+        for letter in msg:
+            node = node.children.setdefault(letter, _TrieNode())
+            node.messages.add(k)
+        return k
+
+    def shared_prefix(self, msg):
+        """
+        :return: (length, messages) of the longest prefix of msg which starts another message, and the indexes
+            of the messages it starts
+        """
+        node = self.root
+        length = 0
+        for letter in msg:
+            child = node.children.get(letter)
+            if child is None:
+                break
+            node = child
+            length += 1
+        return length, sorted(node.messages) if length else []
+
+    def divergence(self, i, j):
+        """
+        :return: The length of the common prefix of messages i and j, which is where they diverge
+        """
+        node = self.root
+        length = 0
+        for letter in self.messages[i]:
+            node = node.children[letter]
+            if j not in node.messages:
+                break
+            length += 1
+        return length
+
+    def divergences(self):
+        """
+        :return: Matrix of the divergence points of every pair of messages. The diagonal is each message's length.
+
+        In sorted order, the common prefix of two messages is the shortest of the common prefixes of the neighbours
+        between them, so each row is a running minimum over the neighbours' divergence points.
+        """
+        count = len(self.messages)
+        order = sorted(range(count), key=lambda k: tuple(self.messages[k]))
+        neighbours = np.array([self.divergence(i, j) for i, j in zip(order, order[1:])], dtype=np.int64)
+        matrix = np.zeros((count, count), dtype=np.int64)
+        for a in range(count - 1):
+            matrix[a, a + 1:] = np.minimum.accumulate(neighbours[a:])
+        matrix = np.maximum(matrix, matrix.T)
+        matrix[np.arange(count), np.arange(count)] = [len(self.messages[k]) for k in order]
+        # Back from sorted order to the order the messages were added in
+        rank = np.argsort(order)
+        return matrix[np.ix_(rank, rank)].tolist()
+
+
+class SuffixAutomaton:
+    """
+    Generalized suffix automaton of the messages.
+
+    Each state is a set of substrings with the same end positions in the messages. The longest of them is length[s]
+    letters long, and the shortest is one letter longer than the longest of link[s]. ends[s] are the (message, end)
+    positions which created the state or reached it first; the end positions of a state are those of all the states
+    whose suffix links lead to it.
+
+    Only the number of messages containing each state is kept. Which messages they are is found by walking the
+    states whose suffix links lead to the state, when asked for.
+    """
+
+    def __init__(self, msgs=()):
+        self.next = [{}]
+        self.link = [-1]
+        self.length = [0]
+        self.ends = [[]]
+        self.messages = []
+        self._message_counts = None
+        self._children = None
+        for m in msgs:
+            self.add(m)
+
+    def _new_state(self, length, link, transitions):
+        self.next.append(transitions)
+        self.link.append(link)
+        self.length.append(length)
+        self.ends.append([])
+        return len(self.length) - 1
+
+    def _clone(self, p, q, letter):
+        clone = self._new_state(self.length[p] + 1, self.link[q], dict(self.next[q]))
+        while p != -1 and self.next[p].get(letter) == q:
+            self.next[p][letter] = clone
+            p = self.link[p]
+        self.link[q] = clone
+        return clone
+
+    def _extend(self, last, letter):
+        q = self.next[last].get(letter)
+        if q is not None:
+            # The string is already in the automaton, from another message
+            if self.length[q] == self.length[last] + 1:
+                return q
+            return self._clone(last, q, letter)
+
+        cur = self._new_state(self.length[last] + 1, 0, {})
+        p = last
+        while p != -1 and letter not in self.next[p]:
+            self.next[p][letter] = cur
+            p = self.link[p]
+        if p != -1:
+            q = self.next[p][letter]
+            self.link[cur] = q if self.length[p] + 1 == self.length[q] else self._clone(p, q, letter)
+        return cur
+
+    def add(self, msg):
+        """
+        :return: The index of the message
+        """
+        k = len(self.messages)
+        self.messages.append(msg)
+        self._message_counts = None
+        self._children = None
+        last = 0
+        for end, letter in enumerate(msg):
+            last = self._extend(last, letter)
+            self.ends[last].append((k, end))
+        return k
+
+    def _by_length(self):
+        """
+        :return: The states, longest first. Each state comes before its suffix link.
+        """
+        return sorted(range(1, len(self.length)), key=self.length.__getitem__, reverse=True)
+
+    def message_counts(self):
+        """
+        :return: For each state, the number of messages which contain its substrings
+        """
+        if self._message_counts is None:
+            prefixes = [[] for _ in self.messages]
+            for s, ends in enumerate(self.ends):
+                for k, _ in ends:
+                    prefixes[k].append(s)
+            counts = [0] * len(self.length)
+            seen = [-1] * len(self.length)
+            # Each prefix of a message counts the message once for its state and the states along its suffix links,
+            # stopping at the first state another prefix of the same message has already counted it for
+            for k, states in enumerate(prefixes):
+                for s in states:
+                    while s > 0 and seen[s] != k:
+                        seen[s] = k
+                        counts[s] += 1
+                        s = self.link[s]
+            # Every message contains the empty string
+            counts[0] = len(self.messages)
+            self._message_counts = counts
+        return self._message_counts
+
+    def children(self):
+        """
+        :return: For each state, the states whose suffix links lead to it
+        """
+        if self._children is None:
+            children = [[] for _ in self.length]
+            for s in range(1, len(self.length)):
+                children[self.link[s]].append(s)
+            self._children = children
+        return self._children
+
+    def state(self, substring):
+        """
+        :return: The state of the substring, or None if no message contains it
+        """
+        s = 0
+        for letter in substring:
+            s = self.next[s].get(letter)
+            if s is None:
+                return None
+        return s
+
+    def messages_containing(self, substring):
+        """
+        :return: The indexes of the messages which contain the substring
+        """
+        s = self.state(substring)
+        if s is None:
+            return []
+        return sorted({k for k, _ in self._end_positions(s)})
+
+    def _end_positions(self, s):
+        children = self.children()
+        ends = []
+        stack = [s]
+        while stack:
+            t = stack.pop()
+            ends.extend(self.ends[t])
+            stack.extend(children[t])
+        return ends
+
+    def shared_substrings(self, min_length=min_length, min_messages=2):
+        """
+        The substrings of at least min_length letters in at least min_messages messages, which can't be made longer
+        at either end without losing an occurrence.
+
+        :return: [(substring, [(message, start), ...]), ...] longest first
+        """
+        counts = self.message_counts()
+        ends_of_message = {(k, len(m) - 1) for k, m in enumerate(self.messages)}
+
+        result = []
+        for s in self._by_length():
+            length = self.length[s]
+            if length < min_length:
+                break
+            if counts[s] < min_messages:
+                continue
+            ends = self._end_positions(s)
+            # A substring followed by the same letter everywhere is part of a longer one
+            if len(self.next[s]) == 1 and not any(end in ends_of_message for end in ends):
+                continue
+            k, end = ends[0]
+            substring = tuple(self.messages[k][end - length + 1:end + 1])
+            result.append((substring, sorted((k, end - length + 1) for k, end in ends)))
+        return result
+
+    def shared_mask(self, min_length=min_length):
+        """
+        :return: For each message, a list of booleans which are True where a letter is part of a substring of at least
+            min_length letters which another message contains as well
+        """
+        masks = [[False] * len(m) for m in self.messages]
+        for substring, starts in self.shared_substrings(min_length):
+            for k, start in starts:
+                masks[k][start:start + len(substring)] = [True] * len(substring)
+        return masks
+
+
+def positional_test(msgs, divergences):
+    """
+    superimp_positional.do_test, superimposing each pair of messages from the point where they diverge.
+    """
+    matches = 0
+    checks = 0
+    for i in range(len(msgs)):
+        for j in range(i + 1, len(msgs)):
+            start = divergences[i][j]
+            match, check = kappa_test(msgs[i][start:], msgs[j][start:], 0)
+            matches += match
+            checks += check
+    return checks, matches
+
+
+def main():
+    msgs = [m.tolist() for m in eye_messages]
+    # The first letters of the eye messages all differ. The shared headers start after them.
+    trie = PrefixTrie(m[1:] for m in msgs)
+    divergences = [[d + 1 for d in row] for row in trie.divergences()]
+    print("Divergence points:")
+    print("    " + "".join(f"{j:>5}" for j in range(len(msgs))))
+    for i, row in enumerate(divergences):
+        print(f"{i:>4}" + "".join(f"{d:>5}" for d in row))
+
+    # Longest prefix each message shares with any other
+    prefixes = [max(d for j, d in enumerate(row) if j != i) for i, row in enumerate(divergences)]
+    automaton = SuffixAutomaton(msgs)
+    print(f"\nShared substrings of {min_length} or more letters outside the shared prefixes:")
+    print("Length  Occurrences (message@start)")
+    for substring, starts in automaton.shared_substrings():
+        if any(start + len(substring) > prefixes[k] for k, start in starts):
+            print(f"{len(substring):>6}  {'  '.join(f'{k}@{start}' for k, start in starts)}")
+
+    checks, matches = positional_test(eye_messages, divergences)
+    print(f"\n== Messages after their shared prefixes ==\n"
+          f"Tests:           {checks:>5}\n"
+          f"Matches:         {matches:>5}\n"
+          f"Coincidence rate: {(matches * 1000 // checks):>4} per thousand")
+
+
+if __name__ == '__main__':
+    main()
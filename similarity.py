@@ -0,0 +1,55 @@
+# Distribution similarity matrices
+#
+# Compares the letter distributions of every message against every other message, and of every column of the
+# messages at some period against every other column. If the messages were enciphered with a periodic key, the
+# columns are shifts of each other, and the best shift between two columns is the difference of their key letters.
+#
+# Writes the chi test and cosine similarity matrices of the messages, and the best shifts between the columns, to
+# stdout.
+
+import numpy as np
+
+from data import eye_messages
+from tests import chi_matrix, cosine_matrix, shifted_chi_matrix
+
+period = 5
+
+
+def letter_counts(msgs, modulus=83):
+    """
+    :return: (messages, modulus) array of the letter counts of each message
+    """
+    return np.array([np.bincount(m, minlength=modulus) for m in msgs])
+
+
+def column_counts(msgs, period, modulus=83):
+    """
+    :return: (period, modulus) array of the letter counts at each position modulo the period, over all messages
+    """
+    counts = np.zeros((period, modulus), dtype=np.int64)
+    for m in msgs:
+        columns = np.arange(len(m)) % period
+        np.add.at(counts, (columns, m), 1)
+    return counts
+
+
+def print_matrix(name, matrix, fmt):
+    print(f"{name}:")
+    print("    " + "".join(f"{j:>7}" for j in range(len(matrix))))
+    for i, row in enumerate(matrix):
+        print(f"{i:>4}" + "".join(f"{x:>7{fmt}}" for x in row))
+    print()
+
+
+def main():
+    counts = letter_counts(eye_messages)
+    print_matrix("Chi test of messages, per thousand", 1000 * chi_matrix(counts), ".1f")
+    print_matrix("Cosine similarity of messages", cosine_matrix(counts), ".3f")
+
+    chi, shifts = shifted_chi_matrix(column_counts(eye_messages, period))
+    print_matrix(f"Best chi test of columns at period {period}, per thousand", 1000 * chi, ".1f")
+    print_matrix(f"Best shifts between columns at period {period}", shifts, "")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,25 +5,32 @@
 
 from matplotlib import pyplot as plt
 
+import cache
 from tests import kappa_test
 from data import eye_messages
 
 bounds = (4, 90)
 
 
-def main():
-    x = list(range(*bounds))
+@cache.cached(version=1, params=("bounds",))
+def coincidence_rates(msgs=eye_messages):
     results_y = []
-    for w in x:
+    for w in range(*bounds):
         matches = 0
         checks = 0
-        for i in range(9):
-            for j in range(9):
-                match, check = kappa_test(eye_messages[i], eye_messages[j], w)
+        for i in range(len(msgs)):
+            for j in range(len(msgs)):
+                match, check = kappa_test(msgs[i], msgs[j], w)
                 matches += match
                 checks += check
 
         results_y.append(1000 * matches / checks)
+    return results_y
+
+
+def main():
+    x = list(range(*bounds))
+    results_y = coincidence_rates()
 
     plt.bar(x, results_y, 0.8, label="Coincidences per 1000")
     plt.plot(bounds, (66, 66), 'g', label="Expected (English)")
@@ -10,12 +10,12 @@ from tests import kappa_test
 from data import eye_messages
 
 
-def do_test(start=0):
+def do_test(start=0, msgs=eye_messages):
     matches = 0
     checks = 0
-    for i in range(9):
-        for j in range(i+1, 9):
-            match, check = kappa_test(eye_messages[i][start:], eye_messages[j][start:], 0)
+    for i in range(len(msgs)):
+        for j in range(i+1, len(msgs)):
+            match, check = kappa_test(msgs[i][start:], msgs[j][start:], 0)
             matches += match
             checks += check
     return checks, matches
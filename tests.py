@@ -9,6 +9,58 @@ def chi_test(dist1, dist2):
     return sum(dist1 * dist2) / ((sum(dist1) * sum(dist2)) or 1)
 
 
+def chi_matrix(dists):
+    """
+    Chi test of every pair of distributions, the rows of dists, as one matrix product.
+    Element [i, j] is chi_test(dists[i], dists[j]).
+    """
+    dists = np.asarray(dists, dtype=np.float64)
+    totals = dists.sum(1)
+    denominator = np.outer(totals, totals)
+    return (dists @ dists.T) / np.where(denominator == 0, 1, denominator)
+
+
+def cosine_matrix(dists):
+    """
+    Cosine similarity of every pair of distributions, the rows of dists. Empty distributions have similarity 0.
+    """
+    dists = np.asarray(dists, dtype=np.float64)
+    norms = np.linalg.norm(dists, axis=1)
+    denominator = np.outer(norms, norms)
+    return (dists @ dists.T) / np.where(denominator == 0, 1, denominator)
+
+
+def shifted_chi_matrix(dists, block=None):
+    """
+    Chi test of every pair of distributions, the rows of dists, with the second one shifted by the amount which
+    gives the highest result. Shifting a distribution by k is the same as adding k to each letter of its text.
+
+    The products for every shift are found at once as a circular cross-correlation, through the FFT, for block rows
+    at a time. By default block keeps each step to about 2**22 elements. Shifts whose products are equal up to
+    rounding error go to the smallest shift.
+    Returns (chi, shift) matrices, where chi[i, j] is chi_test(dists[i], np.roll(dists[j], shift[i, j])).
+    """
+    dists = np.asarray(dists, dtype=np.float64)
+    count, letters = dists.shape
+    spectra = np.fft.rfft(dists, axis=1)
+    totals = dists.sum(1)
+    denominator = np.outer(totals, totals)
+    denominator[denominator == 0] = 1
+    if block is None:
+        block = max(1, 2 ** 22 // max(count * letters, 1))
+
+    products = np.empty((count, count))
+    shifts = np.empty((count, count), dtype=np.int64)
+    for start in range(0, count, block):
+        rows = slice(start, start + block)
+        # correlation[i, j, k] = sum(dists[i] * np.roll(dists[j], k))
+        correlation = np.fft.irfft(spectra[rows, None, :] * spectra[None, :, :].conj(), letters, axis=2)
+        best = correlation.max(2, keepdims=True)
+        shifts[rows] = np.argmax(correlation >= best - 1e-9 * np.abs(best), 2)
+        products[rows] = np.take_along_axis(correlation, shifts[rows, :, None], 2)[:, :, 0]
+    return products / denominator, shifts
+
+
 def phi_test(dist1):
     """
     Phi test for auto-correlation of a distribution.
@@ -36,3 +88,45 @@ def kappa_test(msg1, msg2, width):
     m2 = msg2[:m1.shape[0]]
     m1 = m1[:m2.shape[0]]
     return np.sum(m1 == m2), m1.shape[0]
+
+
+def phi_profile(msg, window):
+    """
+    Phi test for each window of the given length along a message.
+
+    Returns an (N, D) tuple of arrays with one element for each window start, each as phi_test would return
+    for the distribution of that window. Moving the window along by one letter loses the coincidences of the
+    letter leaving it and gains those of the letter entering it, so N is a running sum of those changes.
+    """
+    letters = np.unique(np.asarray(msg), return_inverse=True)[1].ravel()
+    n = letters.shape[0]
+    if window > n:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # Order positions by letter, then position. For each position, count the equal letters less than
+    # a window's length before and after it.
+    keys = letters * (n + window) + np.arange(n)
+    sorted_keys = np.sort(keys)
+    rank = np.searchsorted(sorted_keys, keys)
+    before = rank - np.searchsorted(sorted_keys, keys - (window - 1))
+    after = np.searchsorted(sorted_keys, keys + window) - rank - 1
+
+    pairs = np.concatenate(([0], np.cumsum(before[window:] - after[:n - window]))) + np.sum(before[:window])
+    return 2 * pairs, np.full(pairs.shape[0], window * (window - 1))
+
+
+def kappa_profile(msg1, msg2, window, width=0):
+    """
+    Kappa test for each window of the given length along two ciphertexts.
+
+    Returns an (N, D) tuple of arrays with one element for each window start, each as kappa_test would return
+    for that window of the superimposed ciphertexts.
+    """
+    m1 = msg1[width:]
+    m2 = msg2[:m1.shape[0]]
+    m1 = m1[:m2.shape[0]]
+    if window > m1.shape[0]:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    coincidences = np.concatenate(([0], np.cumsum(m1 == m2)))
+    matches = coincidences[window:] - coincidences[:-window]
+    return matches, np.full(matches.shape[0], window)
@@ -0,0 +1,175 @@
+# Transposition hypotheses
+#
+# Tests reading the messages in another order than the one they are stored in. Each hypothesis is a route through
+# a grid of some width, with the message written into the grid row by row: down the columns, up the columns, down
+# and up alternate columns, or along the rows in alternate directions. Keyed columnar transpositions read the
+# columns in the order of a key.
+#
+# The index permutations of a block of hypotheses are stacked into one array and applied to all messages with one
+# fancy-indexing operation, then every reordered corpus is scored at once:
+#   kappa:    coincidences between messages superimposed with no shift, as in superimp_positional
+#   autokey:  coincidences within the differences of letters `difference` apart, as in autokey_decrypt. The rate of
+#             coincidence of the letters themselves is the same for every reading order.
+#   bigrams, trigrams: repeated strings, counted as in depth.stream_stats
+#
+# Writes the best reading orders of the eye messages to stdout.
+
+import itertools
+
+import numpy as np
+
+from data import eye_messages
+from depth import pad_messages
+
+families = ("columns", "columns_up", "snake", "rows_snake")
+scores = ("kappa", "autokey", "bigrams", "trigrams")
+top = 20
+
+
+def route(length, width, family):
+    """
+    :return: The positions of a message of the given length in the order the route reads them
+    """
+    rows = -(-length // width)
+    grid = np.arange(rows * width).reshape(rows, width)
+    if family == "columns":
+        order = grid.T
+    elif family == "columns_up":
+        order = grid[::-1].T
+    elif family == "snake":
+        order = grid.T.copy()
+        order[1::2] = order[1::2, ::-1]
+    elif family == "rows_snake":
+        order = grid.copy()
+        order[1::2] = order[1::2, ::-1]
+    else:
+        raise ValueError(f"Unknown route family {family!r}")
+    order = order.ravel()
+    return order[order < length]
+
+
+def keyed_route(length, key):
+    """
+    :param key: The columns in the order they are read
+    :return: The positions of a message of the given length, read down the columns in key order
+    """
+    width = len(key)
+    rows = -(-length // width)
+    order = np.arange(rows * width).reshape(rows, width)[:, list(key)].T.ravel()
+    return order[order < length]
+
+
+def route_variants(widths, families=families):
+    """
+    :return: [(label, width, route function of the message length), ...] for every family and width
+    """
+    return [(family, width, lambda length, width=width, family=family: route(length, width, family))
+            for family in families for width in widths]
+
+
+def keyed_variants(width):
+    """
+    :return: The variants for every keyed columnar transposition of the given width
+    """
+    return [("keyed " + ''.join(map(str, key)), width, lambda length, key=key: keyed_route(length, key))
+            for key in itertools.permutations(range(width))]
+
+
+def permutations(variants, lengths):
+    """
+    :return: (V, M, L) array of the indexes to read each message in for each variant. L is the longest length and
+        positions past the end of a message read index L, the padding.
+    """
+    longest = max(lengths)
+    perms = np.full((len(variants), len(lengths), longest), longest, dtype=np.int64)
+    for v, (_, _, order) in enumerate(variants):
+        for m, length in enumerate(lengths):
+            perms[v, m, :length] = order(length)
+    return perms
+
+
+def repeated_strings(reordered, size, modulus=83):
+    """
+    :return: The number of strings of the given size which repeat an earlier string, for each corpus in (V, M, L)
+    """
+    length = reordered.shape[-1] - size + 1
+    codes = np.zeros(reordered.shape[:-1] + (length,), dtype=np.int64)
+    valid = np.ones(codes.shape, dtype=bool)
+    for k in range(size):
+        letters = reordered[..., k:k + length]
+        codes = codes * modulus + letters
+        valid &= letters >= 0
+    codes = np.sort(np.where(valid, codes, -1).reshape(len(reordered), -1), -1)
+    return np.sum((codes[:, 1:] == codes[:, :-1]) & (codes[:, 1:] >= 0), -1)
+
+
+def score_corpora(reordered, difference=1, modulus=83):
+    """
+    :param reordered: (V, M, L) array of corpora, padded with -1
+    :return: {score: array with one element per corpus}, rates as coincidences per 1000
+    """
+    count, _, length = reordered.shape
+    valid = reordered >= 0
+
+    # Letters of all messages at each position
+    cells = np.arange(count * length).reshape(count, 1, length)
+    letter_counts = np.bincount((cells * modulus + reordered)[valid],
+                                minlength=count * length * modulus).reshape(count, length, modulus)
+    n = valid.sum(1)
+    kappa = np.sum(letter_counts * (letter_counts - 1), (1, 2)) / np.maximum(np.sum(n * (n - 1), 1), 1)
+
+    diffs = (reordered[..., difference:] - reordered[..., :-difference]) % modulus
+    diff_valid = valid[..., difference:] & valid[..., :-difference]
+    corpora = np.arange(count).reshape(count, 1, 1)
+    diff_counts = np.bincount((corpora * modulus + diffs)[diff_valid],
+                              minlength=count * modulus).reshape(count, modulus)
+    n = diff_valid.sum((1, 2))
+    autokey = np.sum(diff_counts * (diff_counts - 1), 1) / np.maximum(n * (n - 1), 1)
+
+    return {"kappa": 1000 * kappa, "autokey": 1000 * autokey,
+            "bigrams": repeated_strings(reordered, 2, modulus),
+            "trigrams": repeated_strings(reordered, 3, modulus)}
+
+
+def evaluate(variants, msgs=eye_messages, by="kappa", difference=1, modulus=83, block=256):
+    """
+    Score every variant's reading order of the messages.
+
+    :param variants: As returned by route_variants and keyed_variants
+    :param by: The score to rank the variants by
+    :return: [(label, width, kappa, autokey, bigrams, trigrams), ...] best first
+    """
+    padded = pad_messages(msgs)
+    padded = np.pad(padded, ((0, 0), (0, 1)), constant_values=-1)
+    lengths = [len(m) for m in msgs]
+    rows = np.arange(len(msgs))[:, None]
+
+    table = []
+    for start in range(0, len(variants), block):
+        batch = variants[start:start + block]
+        reordered = padded[rows, permutations(batch, lengths)]
+        result = score_corpora(reordered, difference, modulus)
+        table.extend(zip([label for label, _, _ in batch], [width for _, width, _ in batch],
+                         *(result[s].tolist() for s in scores)))
+    table.sort(key=lambda row: row[2 + scores.index(by)], reverse=True)
+    return table
+
+
+def main():
+    longest = max(len(m) for m in eye_messages)
+    variants = route_variants(range(1, longest + 1))
+    for width in range(3, 7):
+        variants += keyed_variants(width)
+    table = evaluate(variants)
+
+    print(f"{len(table)} reading orders")
+    print("Route             Width  Kappa/1000  Autokey/1000  Bigrams  Trigrams")
+    stored = next(i for i, row in enumerate(table) if row[:2] == ("columns", 1))
+    for rank, (label, width, kappa, autokey, bigrams, trigrams) in enumerate(table):
+        if rank < top or rank == stored:
+            note = "  (stored order)" if rank == stored else ""
+            print(f"{label:<16}  {width:>5}  {kappa:>10.1f}  {autokey:>12.1f}  {bigrams:>7}  {trigrams:>8}{note}")
+
+
+if __name__ == '__main__':
+    main()